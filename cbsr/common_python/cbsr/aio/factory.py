@@ -0,0 +1,187 @@
+from asyncio import Queue, ensure_future, get_event_loop, iscoroutinefunction, run, sleep
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from signal import SIGTERM, SIGINT
+from time import time
+from timeit import default_timer
+
+from aioredis import Redis
+from cbsr.aio.service import AsyncCBSRservice
+from cbsr.factory import CBSRfactory
+from cbsr.liveness import ALIVE_WINDOW, REAP_INTERVAL, get_expired, get_liveness_queries
+from cbsr.subscriber import DispatchLatency
+from redis import Redis as BlockingRedis
+
+
+class AsyncCBSRfactory(object):
+    """Asyncio variant of CBSRfactory: a single event loop with one async Redis connection pool and one pubsub
+    connection serves all devices. Each service gets a queue that is drained by its own (cheap) task, so messages
+    to one service are handled in order whilst different services are handled concurrently.
+
+    Existing (thread-based) CBSRservice implementations can be returned from create_service as well:
+    their plain handlers are then run on the executor, using a connection from a (synchronous) shared pool."""
+
+    def __init__(self, max_workers=None):
+        self.active = {}
+        self.routes = {}
+        self.latency = DispatchLatency()
+        self.reap_interval = REAP_INTERVAL
+        self.running = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.redis = None
+        self.pubsub = None
+        self.sync_redis = None
+        self.loop = None
+
+    def get_connection_channel(self):
+        return None  # TO IMPLEMENT
+
+    def get_connection_channels(self):
+        """See CBSRfactory.get_connection_channels"""
+        return [self.get_connection_channel()]
+
+    def create_service(self, connect, identifier, disconnect):
+        """Return either an AsyncCBSRservice (using connect) or a CBSRservice (using get_sync_connection)"""
+        return None  # TO IMPLEMENT
+
+    @staticmethod
+    def connect():
+        host = getenv('DB_IP')
+        password = getenv('DB_PASS')
+        self_signed = getenv('DB_SSL_SELFSIGNED')
+        if self_signed == '1':
+            return Redis(host=host, ssl=True, ssl_ca_certs='cert.pem', password=password)
+        else:
+            return Redis(host=host, ssl=True, password=password)
+
+    def get_connection(self):
+        """Returns an async client that borrows its connections from the factory's pool"""
+        return Redis(connection_pool=self.redis.connection_pool)
+
+    def get_sync_connection(self):
+        """Returns a blocking client for adapted CBSRservice instances (from a single shared pool)"""
+        if self.sync_redis is None:
+            self.sync_redis = CBSRfactory.connect()
+        return BlockingRedis(connection_pool=self.sync_redis.connection_pool)
+
+    def run(self):
+        run(self.main())
+
+    async def main(self):
+        self.loop = get_event_loop()
+        self.loop.add_signal_handler(SIGTERM, self.stop)
+        self.loop.add_signal_handler(SIGINT, self.stop)
+        self.running = True
+
+        self.redis = self.connect()
+        print('Subscribing...')
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(*self.get_connection_channels())
+        reaper = ensure_future(self.reap())
+        try:
+            async for message in self.pubsub.listen():
+                await self.dispatch(message)
+        finally:
+            reaper.cancel()
+            await self.cleanup()
+
+    async def dispatch(self, message):
+        channel = message['channel'].decode('utf-8')
+        if channel in self.get_connection_channels():
+            await self.start_service(message)
+            return
+        route = self.routes.get(channel)
+        if route:
+            handler, queue = route
+            queue.put_nowait((handler, message, default_timer()))
+
+    async def start_service(self, message):
+        data = message['data'].decode('utf-8')
+        if data in self.active:
+            print('Reusing already running service for ' + data)
+        else:
+            print('Launching new service for ' + data)
+            service = self.create_service(self.get_connection, data, self.disconnect_service)
+            mapping = service.get_channel_action_mapping()
+            queue = Queue()
+            self.active[data] = (service, queue, mapping)
+            for channel, handler in mapping.items():
+                self.routes[channel] = (handler, queue)
+            ensure_future(self.serve(queue))
+            if isinstance(service, AsyncCBSRservice):
+                service.executor = self.executor
+            await self.pubsub.subscribe(*mapping.keys())
+
+    async def serve(self, queue):
+        while True:
+            handler, message, received = await queue.get()
+            if handler is None:
+                break
+            try:
+                if iscoroutinefunction(handler):
+                    await handler(message)
+                else:
+                    await self.loop.run_in_executor(self.executor, handler, message)
+            except Exception as err:
+                print('Handling ' + str(message['channel']) + ' failed: ' + str(err))
+            self.latency.add(default_timer() - received)
+
+    async def reap(self):
+        while self.running:
+            await sleep(self.reap_interval)
+            if not self.active:
+                continue
+            services = dict((identifier, entry[0]) for identifier, entry in self.active.items())
+            queries = get_liveness_queries(services)
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                min_score = time() - ALIVE_WINDOW
+                for user in queries.keys():
+                    pipe.zrangebyscore(user, min_score, '+inf')
+                expired = get_expired(queries, await pipe.execute())
+            except Exception as err:
+                print('Liveness check failed: ' + str(err))
+                continue
+            for identifier in expired:
+                print('Device left; shutting down ' + identifier)
+                service = services[identifier]
+                if isinstance(service, AsyncCBSRservice):
+                    await service.shutdown()
+                else:
+                    await self.loop.run_in_executor(self.executor, service.shutdown)
+
+    def disconnect_service(self, identifier):
+        # Adapted services disconnect from their own threads, so always hop back onto the loop
+        self.loop.call_soon_threadsafe(ensure_future, self.remove_service(identifier))
+
+    async def remove_service(self, identifier):
+        entry = self.active.pop(identifier, None)
+        if entry:
+            service, queue, mapping = entry
+            for channel in mapping.keys():
+                self.routes.pop(channel, None)
+            queue.put_nowait((None, None, None))
+            await self.pubsub.unsubscribe(*mapping.keys())
+
+    def stop(self):
+        print('Trying to exit gracefully...')
+        self.running = False
+        ensure_future(self.pubsub.unsubscribe())
+
+    async def cleanup(self):
+        try:
+            for service, queue, mapping in list(self.active.values()):
+                if isinstance(service, AsyncCBSRservice):
+                    await service.cleanup()
+                else:
+                    service.cleanup()
+                queue.put_nowait((None, None, None))
+            print('Dispatch latency: ' + str(self.latency))
+            await self.pubsub.close()
+            await self.redis.close()
+            if self.sync_redis is not None:
+                self.sync_redis.close()
+            self.executor.shutdown(wait=False)
+            print('Graceful exit was successful')
+        except Exception as err:
+            print('Graceful exit has failed: ' + str(err))
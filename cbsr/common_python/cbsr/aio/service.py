@@ -0,0 +1,75 @@
+from asyncio import Event, get_event_loop
+
+
+class AsyncCBSRservice(object):
+    """Coroutine-based counterpart of CBSRservice, to be created by an AsyncCBSRfactory.
+    All handlers in get_channel_action_mapping should be coroutines; blocking (CPU-bound) work
+    should be handed off with run_in_executor so that it does not stall the other services."""
+
+    def __init__(self, connect, identifier, disconnect, executor=None):
+        self.redis = connect()
+        self.identifier = identifier
+        self.disconnect = disconnect
+        self.executor = executor
+        self.running = True
+        self.image_available = Event()
+
+    def get_device_types(self):
+        return []  # TO IMPLEMENT
+
+    def get_channel_action_mapping(self):
+        return {}  # TO IMPLEMENT
+
+    async def cleanup(self):
+        pass  # TO IMPLEMENT
+
+    def get_full_channel(self, channel_name):
+        return self.identifier + '_' + channel_name
+
+    def get_user_id(self):
+        return self.identifier.split('-')[0]
+
+    def get_device_id(self):
+        return self.identifier.split('-')[1]
+
+    async def run_in_executor(self, func, *args):
+        """Runs a blocking call (e.g. model inference) on the executor without blocking the event loop"""
+        return await get_event_loop().run_in_executor(self.executor, func, *args)
+
+    async def on_image_available(self, message):
+        self.image_available.set()
+
+    async def frames(self):
+        """Yields the most recent image each time one is announced; map 'image_available' to on_image_available"""
+        while self.running:
+            await self.image_available.wait()
+            self.image_available.clear()
+            if not self.running:
+                break
+            yield await self.redis.get(self.get_full_channel('image_stream'))
+
+    async def audio(self, channel_name, timeout=1):
+        """Yields the chunks pushed onto the given list (e.g. 'audio_stream') by blocking on it"""
+        key = self.get_full_channel(channel_name)
+        while self.running:
+            item = await self.redis.blpop(key, timeout=timeout)
+            if item:
+                yield item[1]
+
+    async def publish(self, channel, data):
+        await self.redis.publish(self.get_full_channel(channel), data)
+
+    async def produce_event(self, event):
+        await self.publish('events', event)
+
+    async def shutdown(self):
+        await self.cleanup()
+        self.running = False
+        self.image_available.set()
+        print('Trying to exit gracefully...')
+        try:
+            await self.redis.close()
+            print('Graceful exit was successful')
+        except Exception as err:
+            print('Graceful exit has failed: ' + str(err))
+        self.disconnect(self.identifier)
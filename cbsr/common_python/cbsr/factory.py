@@ -1,20 +1,46 @@
 from os import getenv
 from signal import pause, signal, SIGTERM, SIGINT
+from socket import gethostname
 from sys import exit
+from threading import Event, Lock, Thread
+from time import time
+from uuid import uuid4
 
-from redis import Redis
+from redis import Redis, RedisError
+
+from cbsr.liveness import ALIVE_WINDOW, REAP_INTERVAL, get_expired, get_liveness_queries
+from cbsr.placement import REPLICA_WINDOW, get_owner
+from cbsr.subscriber import CBSRsubscriber
 
 
 class CBSRfactory(object):
     def __init__(self):
         self.active = {}
+        self.active_lock = Lock()
 
-        # Redis initialization
+        # Redis initialization: all services share the connection pool of this client,
+        # and all of their channels are multiplexed over the single (blocking) subscriber below.
         self.redis = self.connect()
+
+        # Several replicas of a factory can run side by side; each identifier is placed on exactly one of them.
+        # The replicas keep a heartbeat in 'replicas:<channel>', and 'placement:<channel>' maps each identifier
+        # to the replica that runs its service.
+        # (the host name and pid are the same for every container of a scaled service, so a random part is added)
+        self.replica = gethostname() + ':' + uuid4().hex[:8]
+        self.replicas_key = 'replicas:' + self.get_connection_channel()
+        self.placement_key = 'placement:' + self.get_connection_channel()
+        self.replicas = self.heartbeat()
+        print('Running as replica ' + self.replica + ' (' + str(len(self.replicas)) + ' in total)')
+
         print('Subscribing...')
-        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
-        self.pubsub.subscribe(**{self.get_connection_channel(): self.start_service})
-        self.pubsub_thread = self.pubsub.run_in_thread(sleep_time=0.001)
+        self.subscriber = CBSRsubscriber(self.redis, dict((channel, self.start_service)
+                                                          for channel in self.get_connection_channels()))
+
+        # A single reaper keeps the placement up-to-date and shuts down the services of all devices that are gone
+        self.reap_interval = REAP_INTERVAL
+        self.reaper_stop = Event()
+        self.reaper = Thread(target=self.reap)
+        self.reaper.start()
 
         # Register cleanup handlers
         signal(SIGTERM, self.cleanup)
@@ -24,6 +50,11 @@ class CBSRfactory(object):
     def get_connection_channel(self):
         return None  # TO IMPLEMENT
 
+    def get_connection_channels(self):
+        """The channels on which the identifiers to launch a service for are announced (by default only the
+        connection channel); an identifier that is announced on several of them gets a single service"""
+        return [self.get_connection_channel()]
+
     def create_service(self, connect, identifier, disconnect):
         return None  # TO IMPLEMENT
 
@@ -37,17 +68,92 @@ class CBSRfactory(object):
         else:
             return Redis(host=host, ssl=True, password=password)
 
+    def get_connection(self):
+        """Returns a client that borrows its connections from the factory's pool"""
+        return Redis(connection_pool=self.redis.connection_pool)
+
     def start_service(self, message):
         data = message['data'].decode('utf-8')
-        if data in self.active:
-            print('Reusing already running service for ' + data)
+        owner = get_owner(data, self.replicas)
+        if owner == self.replica:
+            self.launch_service(data)
         else:
-            print('Launching new service for ' + data)
-            service = self.create_service(self.connect, data, self.disconnect_service)
-            self.active[data] = service
+            print('Service for ' + data + ' is placed on ' + owner)
+
+    def launch_service(self, identifier):
+        with self.active_lock:
+            if identifier in self.active:
+                print('Reusing already running service for ' + identifier)
+            else:
+                print('Launching new service for ' + identifier)
+                service = self.create_service(self.get_connection, identifier, self.disconnect_service)
+                self.active[identifier] = service
+                self.subscriber.subscribe(**service.get_channel_action_mapping())
+                self.redis.hset(self.placement_key, identifier, self.replica)
 
     def disconnect_service(self, identifier):
-        self.active.pop(identifier)
+        with self.active_lock:
+            service = self.active.pop(identifier, None)
+            if service:
+                self.subscriber.unsubscribe(*service.get_channel_action_mapping().keys())
+                if self.redis.hget(self.placement_key, identifier) == self.replica.encode('utf-8'):
+                    self.redis.hdel(self.placement_key, identifier)
+
+    def heartbeat(self):
+        """Registers this replica and returns all (sorted) replicas that are currently alive"""
+        now = time()
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.replicas_key, {self.replica: now})
+        pipe.zremrangebyscore(self.replicas_key, '-inf', now - REPLICA_WINDOW)
+        pipe.zrange(self.replicas_key, 0, -1)
+        return sorted(replica.decode('utf-8') for replica in pipe.execute()[-1])
+
+    def rebalance(self, replicas):
+        """Hands over the services that are now placed on another replica (by announcing them again),
+        and takes over the services that were placed on replicas that are gone"""
+        print('Replicas changed: ' + ', '.join(replicas))
+        self.replicas = replicas
+        with self.active_lock:
+            services = dict(self.active)
+        for identifier, service in services.items():
+            if get_owner(identifier, replicas) != self.replica:
+                print('Handing over ' + identifier)
+                service.shutdown()
+                self.redis.publish(self.get_connection_channel(), identifier)
+        for identifier, replica in self.redis.hgetall(self.placement_key).items():
+            identifier = identifier.decode('utf-8')
+            replica = replica.decode('utf-8')
+            if replica not in replicas and get_owner(identifier, replicas) == self.replica:
+                print('Taking over ' + identifier + ' from ' + replica)
+                self.launch_service(identifier)
+
+    def reap(self):
+        while not self.reaper_stop.wait(self.reap_interval):
+            try:
+                replicas = self.heartbeat()
+                if replicas != self.replicas:
+                    self.rebalance(replicas)
+            except RedisError as err:
+                print('Placement update failed: ' + str(err))
+
+            with self.active_lock:
+                services = dict(self.active)
+            if not services:
+                continue
+            queries = get_liveness_queries(services)
+            try:
+                # One ZRANGEBYSCORE per user, all in a single round-trip
+                pipe = self.redis.pipeline(transaction=False)
+                min_score = time() - ALIVE_WINDOW
+                for user in queries.keys():
+                    pipe.zrangebyscore(user, min_score, '+inf')
+                expired = get_expired(queries, pipe.execute())
+            except RedisError as err:
+                print('Liveness check failed: ' + str(err))
+                continue
+            for identifier in expired:
+                print('Device left; shutting down ' + identifier)
+                services[identifier].shutdown()
 
     def run(self):
         while self.running:
@@ -57,10 +163,14 @@ class CBSRfactory(object):
         self.running = False
         print('Trying to exit gracefully...')
         try:
-            self.pubsub_thread.stop()
-            self.redis.close()
+            print('Dispatch latency: ' + str(self.subscriber.latency))
+            self.subscriber.stop()
+            self.reaper_stop.set()
+            # Leaving the replica set makes the other replicas take over our services on their next heartbeat
+            self.redis.zrem(self.replicas_key, self.replica)
             for service in self.active.values():
                 service.cleanup()
+            self.redis.close()
             print('Graceful exit was successful')
         except Exception as err:
             print('Graceful exit has failed: ' + err.message)
@@ -0,0 +1,27 @@
+ANNOUNCE_INTERVAL = 60  # devices announce themselves every 59.9 seconds (timestamped with their own clock)
+# A device is considered gone when it missed two announcements, so that a late announcement (or a clock that is
+# somewhat behind) does not shut down the services of a device that is still there; a device that leaves cleanly
+# removes itself right away.
+ALIVE_WINDOW = 2.5 * ANNOUNCE_INTERVAL
+REAP_INTERVAL = 5.0
+
+
+def get_liveness_queries(services):
+    """Groups the given {identifier: service} per sorted set of their user ('user:<id>'),
+    together with the members ('<device>:<type>') of that set that can keep each service alive"""
+    queries = {}
+    for identifier, service in services.items():
+        device_id = service.get_device_id()
+        members = set(device_id + ':' + device_type for device_type in service.get_device_types())
+        queries.setdefault('user:' + service.get_user_id(), []).append((identifier, members))
+    return queries
+
+
+def get_expired(queries, results):
+    """Returns the identifiers of all services for which none of their members were found in the results
+    of a ZRANGEBYSCORE (over the last ALIVE_WINDOW seconds) for each user in the given queries"""
+    expired = []
+    for services, alive in zip(queries.values(), results):
+        alive = set(member.decode('utf-8') for member in alive)
+        expired.extend(identifier for identifier, members in services if not (members & alive))
+    return expired
@@ -0,0 +1,54 @@
+from os import getenv
+from time import time
+
+import cv2
+import numpy as np
+
+GATE_WIDTH = 160  # pixels; the frames are compared at (at most) this resolution
+PIXEL_THRESHOLD = 25  # the minimal (grayscale) difference of a pixel that changed since the previous frame
+FOREGROUND_RATIO = 0.01  # the fraction of foreground pixels above which the scene is considered changed
+DIFFERENCE_RATIO = 0.01  # the fraction of changed pixels above which the scene is considered changed
+# The maximum number of seconds between two frames that are processed, even when the scene does not change
+HEARTBEAT = float(getenv('VISION_HEARTBEAT') or 2.0)
+
+
+class MotionGate(object):
+    """
+    Decides for each frame of a camera whether it is worth processing (e.g. detecting faces in), which is only
+    the case when the scene changed: either the background subtractor (MOG2) marks enough of the frame as foreground,
+    or enough of the frame differs from the previous one. A frame is processed at least once per heartbeat,
+    so that e.g. someone that sits still is still recognised. Both checks run on a small grayscale copy of the frame.
+    """
+
+    def __init__(self, heartbeat=HEARTBEAT):
+        self.heartbeat = heartbeat
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+        self.previous = None
+        self.processed = 0
+
+    def is_changed(self, frame):
+        """:param frame: the (RGB(A)) frame as an array
+        :return: whether the frame should be processed"""
+        small = self.to_small_gray(frame)
+        foreground = np.count_nonzero(self.subtractor.apply(small)) / float(small.size)
+        if self.previous is None or self.previous.shape != small.shape:
+            difference = 1.0
+        else:
+            difference = np.count_nonzero(cv2.absdiff(small, self.previous) > PIXEL_THRESHOLD) / float(small.size)
+        self.previous = small
+
+        now = time()
+        if foreground > FOREGROUND_RATIO or difference > DIFFERENCE_RATIO or now - self.processed >= self.heartbeat:
+            self.processed = now
+            return True
+        return False
+
+    @staticmethod
+    def to_small_gray(frame):
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2GRAY if frame.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+        height, width = frame.shape[:2]
+        if width > GATE_WIDTH:
+            frame = cv2.resize(frame, (GATE_WIDTH, max(1, height * GATE_WIDTH // width)),
+                               interpolation=cv2.INTER_AREA)
+        return frame
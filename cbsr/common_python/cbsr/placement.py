@@ -0,0 +1,9 @@
+from hashlib import md5
+
+REPLICA_WINDOW = 15  # a factory that did not send a heartbeat for this many seconds is considered gone
+
+
+def get_owner(identifier, replicas):
+    """Rendezvous (highest random weight) hashing: every replica computes the same owner for an identifier
+    given the same set of replicas, and only the identifiers of a joining or leaving replica change owner"""
+    return max(replicas, key=lambda replica: md5((replica + '/' + identifier).encode('utf-8')).hexdigest())
@@ -0,0 +1,27 @@
+from time import time
+
+REPORT_INTERVAL = 2.0  # seconds between the reports of the processing rate
+SMOOTHING = 0.2  # the weight of the latest frame in the (exponential moving) average duration
+
+
+class RateReporter(object):
+    """
+    Measures the rate at which a (vision) service can process the frames of a camera, and reports it to the camera
+    on the processing_rate channel (as '<name>;<frames per second>'), so that the camera does not upload more frames
+    than its consumers can handle (see VideoProcessingModule.set_processing_rate).
+    """
+
+    def __init__(self, service, name):
+        self.service = service
+        self.name = name
+        self.duration = None
+        self.reported = 0
+
+    def processed(self, started):
+        """Registers a frame of which the processing started at the given time (and has just ended)"""
+        duration = time() - started
+        self.duration = duration if self.duration is None else SMOOTHING * duration + (1 - SMOOTHING) * self.duration
+        now = time()
+        if now - self.reported >= REPORT_INTERVAL and self.duration > 0:
+            self.reported = now
+            self.service.publish('processing_rate', self.name + ';' + '%.2f' % (1.0 / self.duration))
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+
+PADDING = 0.5  # the margin around a previous face box that is searched, relative to the size of the box
+FULL_SCAN_INTERVAL = 10  # a full frame is scanned (at least) once per this many frames
+# Frames that are wider than this are downscaled to it for a full scan; smaller frames are scanned as they are,
+# as the detectors (HOG without upsampling) would miss the smaller faces at a lower resolution
+MAX_SCAN_WIDTH = 640
+
+
+class ROIScheduler(object):
+    """
+    Schedules where the faces are searched for in each frame of a camera: faces usually stay close to where they
+    were in the previous frame, so only the (padded) regions around the previous face boxes are searched
+    (at full resolution). The full frame is scanned (at most MAX_SCAN_WIDTH wide) when there were no faces before,
+    when no faces were found in the regions anymore, and once per FULL_SCAN_INTERVAL frames (for new faces).
+
+    The face boxes are (top, right, bottom, left) tuples in frame coordinates, as with face_recognition.
+    """
+
+    def __init__(self, padding=PADDING, full_scan_interval=FULL_SCAN_INTERVAL, max_scan_width=MAX_SCAN_WIDTH):
+        self.padding = padding
+        self.full_scan_interval = full_scan_interval
+        self.max_scan_width = max_scan_width
+        self.boxes = []
+        self.frames = 0
+
+    def detect(self, frame, detector):
+        """
+        :param frame: the frame (as an array) to detect the faces in
+        :param detector: function that returns the face boxes in a given (part of a) frame
+        :return: the face boxes in frame coordinates
+        """
+        self.frames += 1
+        boxes = []
+        if self.boxes and self.frames % self.full_scan_interval != 0:
+            for top, right, bottom, left in self.get_regions(frame.shape[0], frame.shape[1]):
+                boxes.extend((box_top + top, box_right + left, box_bottom + top, box_left + left)
+                             for box_top, box_right, box_bottom, box_left
+                             in detector(np.ascontiguousarray(frame[top:bottom, left:right])))
+        if not boxes:
+            boxes = self.scan(frame, detector)
+        self.boxes = boxes
+        return boxes
+
+    def scan(self, frame, detector):
+        """:return: the face boxes in the full frame (downscaled if it is wider than max_scan_width)"""
+        scale = float(self.max_scan_width) / frame.shape[1]
+        if scale >= 1:
+            return list(detector(frame))
+        small = cv2.resize(np.ascontiguousarray(frame), (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return [tuple(int(round(coordinate / scale)) for coordinate in box) for box in detector(small)]
+
+    def get_regions(self, height, width):
+        """:return: the (top, right, bottom, left) regions around the previous face boxes, with overlaps merged"""
+        regions = []
+        for top, right, bottom, left in self.boxes:
+            margin_y = int((bottom - top) * self.padding)
+            margin_x = int((right - left) * self.padding)
+            region = [max(top - margin_y, 0), min(right + margin_x, width),
+                      min(bottom + margin_y, height), max(left - margin_x, 0)]
+            overlapping = True
+            while overlapping:
+                overlapping = [other for other in regions if region[0] < other[2] and other[0] < region[2]
+                               and region[3] < other[1] and other[3] < region[1]]
+                for other in overlapping:
+                    regions.remove(other)
+                    region = [min(region[0], other[0]), max(region[1], other[1]),
+                              max(region[2], other[2]), min(region[3], other[3])]
+            regions.append(region)
+        return [tuple(region) for region in regions if region[2] > region[0] and region[1] > region[3]]
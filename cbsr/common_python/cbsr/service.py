@@ -1,7 +1,3 @@
-from threading import Thread
-from time import gmtime, mktime, sleep
-
-
 class CBSRservice(object):
     def __init__(self, connect, identifier, disconnect):
         self.redis = connect()
@@ -9,15 +5,9 @@ class CBSRservice(object):
         self.disconnect = disconnect
         self.running = True
 
-        # Redis initialization
-        print('Subscribing ' + identifier)
-        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
-        self.pubsub.subscribe(**self.get_channel_action_mapping())
-        self.pubsub_thread = self.pubsub.run_in_thread(sleep_time=0.001)
-
-        # Ensure we'll shutdown at some point again
-        check_if_alive = Thread(target=self.check_if_alive)
-        check_if_alive.start()
+        # The channels from get_channel_action_mapping are subscribed to by the factory,
+        # which owns the (shared) pubsub connection and routes each message to its handler.
+        # The factory will also call shutdown once none of the get_device_types are alive anymore.
 
     def get_device_types(self):
         return []  # TO IMPLEMENT
@@ -37,31 +27,6 @@ class CBSRservice(object):
     def get_device_id(self):
         return self.identifier.split('-')[1]
 
-    def check_if_alive(self):
-        user = 'user:' + self.get_user_id()
-        device_id = self.get_device_id()
-        devices = []
-        for device_type in self.get_device_types():
-            devices.append(device_id + ':' + device_type)
-        while True:
-            try:
-                pipe = self.redis.pipeline()
-                for device in devices:
-                    pipe.zscore(user, device)
-                found_one = False
-                one_minute = mktime(gmtime()) - 60
-                for score in pipe.execute():
-                    if score >= one_minute:
-                        found_one = True
-                        break
-                if found_one:
-                    sleep(60.1)
-                    continue
-            except:
-                pass
-            self.shutdown()
-            break
-
     def publish(self, channel, data):
         self.redis.publish(self.get_full_channel(channel), data)
 
@@ -73,7 +38,6 @@ class CBSRservice(object):
         self.running = False
         print('Trying to exit gracefully...')
         try:
-            self.pubsub_thread.stop()
             self.redis.close()
             print('Graceful exit was successful')
         except Exception as err:
@@ -0,0 +1,82 @@
+from threading import Lock, Thread, current_thread
+from timeit import default_timer
+from uuid import uuid4
+
+
+class DispatchLatency(object):
+    """Running statistics (in milliseconds) of the time between reading a message and its handler returning"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        millis = seconds * 1000
+        with self.lock:
+            self.count += 1
+            self.total += millis
+            if millis > self.max:
+                self.max = millis
+
+    def mean(self):
+        return (self.total / self.count) if self.count else 0.0
+
+    def __str__(self):
+        return 'n=%d mean=%.2fms max=%.2fms' % (self.count, self.mean(), self.max)
+
+
+class CBSRsubscriber(object):
+    """Runs the handlers of a pubsub connection from a thread that blocks on its socket (instead of polling it).
+    A private wakeup channel is always subscribed, which keeps the connection alive and allows stop() to
+    interrupt the blocking read."""
+
+    def __init__(self, redis, mapping=None, on_dispatch=None):
+        self.redis = redis
+        self.on_dispatch = on_dispatch
+        self.latency = DispatchLatency()
+        self.running = True
+
+        self.wakeup_channel = 'wakeup_' + uuid4().hex
+        self.pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(**{self.wakeup_channel: self.wakeup})
+        if mapping:
+            self.pubsub.subscribe(**mapping)
+
+        self.thread = Thread(target=self.listen)
+        self.thread.start()
+
+    def subscribe(self, **mapping):
+        self.pubsub.subscribe(**mapping)
+
+    def unsubscribe(self, *channels):
+        if channels:
+            self.pubsub.unsubscribe(*channels)
+
+    def listen(self):
+        while self.running:
+            response = self.pubsub.parse_response(block=True)
+            if response is None:
+                continue
+            start = default_timer()
+            try:
+                self.pubsub.handle_message(response)
+            except Exception as err:
+                # all services share this thread, so a failing handler should not stop the dispatching for the others
+                print('Handling ' + str(response[1]) + ' failed: ' + str(err))
+            if response[0] == b'message' and self.running:
+                duration = default_timer() - start
+                self.latency.add(duration)
+                if self.on_dispatch:
+                    self.on_dispatch(duration)
+
+    def wakeup(self, message):
+        pass  # only used to interrupt the blocking read in listen
+
+    def stop(self, timeout=5.0):
+        self.running = False
+        self.redis.publish(self.wakeup_channel, '')
+        if current_thread() is not self.thread:
+            self.thread.join(timeout)
+        self.pubsub.close()
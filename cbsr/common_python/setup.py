@@ -1,9 +1,15 @@
+from sys import version_info
+
 from setuptools import setup
 
+packages = ['cbsr']
+if version_info[0] >= 3:
+    packages.append('cbsr.aio')  # the asyncio runtime is not available for the Python 2 images
+
 setup(
   name='cbsr_common',
   version='0.0.1',
   author='Vincent Koeman',
   author_email='v.j.koeman@vu.nl',
-  packages=['cbsr'],
-)
\ No newline at end of file
+  packages=packages,
+)
@@ -1,3 +1,5 @@
+from os import getenv
+
 from cbsr.factory import CBSRfactory
 
 from emotion_detection_service import EmotionDetectionService
@@ -15,5 +17,8 @@ class EmotionDetectionFactory(CBSRfactory):
 
 
 if __name__ == '__main__':
-    emotion_detection_factory = EmotionDetectionFactory()
-    emotion_detection_factory.run()
+    if getenv('VISION_PIPELINE') == '1':
+        print('Emotion detection is run by the vision pipeline (see VISION_PIPELINE)')
+    else:
+        emotion_detection_factory = EmotionDetectionFactory()
+        emotion_detection_factory.run()
@@ -1,19 +1,29 @@
 """ All Credits goes to https://github.com/vjgpt/Face-and-Emotion-Recognition """
+from os import getenv
+from os.path import abspath, dirname, join
 from threading import Event, Thread
+from time import time
 
 import cv2
 import numpy as np
 from PIL import Image
+from cbsr.motion import MotionGate
+from cbsr.rate import RateReporter
+from cbsr.roi import ROIScheduler
 from cbsr.service import CBSRservice
 from dlib import get_frontal_face_detector
-from imutils import face_utils, resize
+from imutils import resize
 # direct import from keras has a bug see: https://stackoverflow.com/a/59810484/3668659
 from tensorflow.python.keras.models import load_model
 
+from emotion_tracker import EmotionTracker
 from utils.datasets import get_labels
 from utils.inference import apply_offsets
 from utils.preprocessor import preprocess_input
 
+# The maximum number of seconds between two publications of the (unchanged) emotion of a face
+PUBLISH_INTERVAL = float(getenv('EMOTION_PUBLISH_INTERVAL') or 1.0)
+
 
 class EmotionDetectionService(CBSRservice):
     def __init__(self, connect, identifier, disconnect):
@@ -27,14 +37,22 @@ class EmotionDetectionService(CBSRservice):
         self.save_image = False
         self.is_image_available = False
         self.image_available_flag = Event()
+        # Only frames in which the scene changed (or one per heartbeat) are processed
+        self.motion_gate = MotionGate()
+        # Faces are searched for around where they were in the previous frame first
+        self.roi = ROIScheduler()
+        # The camera adapts its frame rate to the rate at which the frames are processed
+        self.rate_reporter = RateReporter(self, 'emotion_detection')
         # Emotion detection parameters
         self.emotion_labels = get_labels('fer2013')
         # hyper-parameters for bounding boxes shape
         self.frame_window = 10
         self.emotion_offsets = (20, 40)
+        # the emotion of each face is smoothed over (at most) frame_window frames
+        self.emotion_tracker = EmotionTracker(self.frame_window, PUBLISH_INTERVAL)
         # loading models
         self.detector = get_frontal_face_detector()
-        self.emotion_classifier = load_model('emotion_model.hdf5', compile=False)
+        self.emotion_classifier = load_model(join(dirname(abspath(__file__)), 'emotion_model.hdf5'), compile=False)
         # getting input model shapes for inference
         self.emotion_target_size = self.emotion_classifier.input_shape[1:3]
 
@@ -67,6 +85,7 @@ class EmotionDetectionService(CBSRservice):
             if self.is_image_available:
                 self.is_image_available = False
                 self.image_available_flag.clear()
+                started = time()
 
                 # Create a PIL Image from byte string from redis result
                 image_stream = self.redis.get(self.get_full_channel('image_stream'))
@@ -77,30 +96,49 @@ class EmotionDetectionService(CBSRservice):
                 image = Image.frombytes('RGB', (self.image_width, self.image_height), image_stream)
 
                 ima = np.asarray(image, dtype=np.uint8)
+                if not self.motion_gate.is_changed(ima):
+                    continue
                 frame = resize(ima, width=min(self.image_width, ima.shape[1]))
                 gray_image = cv2.cvtColor(frame, cv2.COLOR_BGRA2GRAY)
                 rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
 
                 # Detect all faces in the image and run the classifier on them
-                faces = self.detector(rgb_image)
-                for face_coordinates in faces:
-                    x1, x2, y1, y2 = apply_offsets(face_utils.rect_to_bb(face_coordinates), self.emotion_offsets)
-                    gray_face = gray_image[y1:y2, x1:x2]
-                    gray_face = cv2.resize(gray_face, self.emotion_target_size)
-                    gray_face = preprocess_input(gray_face, True)
-                    gray_face = np.expand_dims(gray_face, 0)
-                    gray_face = np.expand_dims(gray_face, -1)
-                    emotion_prediction = self.emotion_classifier.predict(gray_face)
-
-                    # Get the emotion predicted as most probable
-                    emotion_label_arg = np.argmax(emotion_prediction)
-                    emotion_text = self.emotion_labels[emotion_label_arg]
-                    print(self.identifier + ': detected ' + emotion_text)
-                    self.publish('detected_emotion', emotion_text)
+                faces = self.roi.detect(rgb_image, self.detect_faces)
+                self.classify_emotions(gray_image, faces)
+                self.rate_reporter.processed(started)
             else:
                 self.image_available_flag.wait()
         self.produce_event('EmotionDetectionStarted')
 
+    def classify_emotions(self, gray_image, faces):
+        """
+        Classifies the emotion of each of the given (top, right, bottom, left) faces in the (grayscale) image,
+        all in a single batch, and publishes the smoothed emotions (see EmotionTracker) as 'emotion;confidence'.
+        """
+        tracks = [track for track in self.emotion_tracker.assign(faces) if track.needs_inference()]
+        if not tracks:
+            return
+        gray_faces = []
+        for track in tracks:
+            top, right, bottom, left = track.box
+            x1, x2, y1, y2 = apply_offsets((left, top, right - left, bottom - top), self.emotion_offsets)
+            gray_face = gray_image[max(y1, 0):y2, max(x1, 0):x2]
+            gray_face = cv2.resize(gray_face, self.emotion_target_size)
+            gray_faces.append(preprocess_input(gray_face, True))
+        emotion_predictions = self.emotion_classifier.predict(np.expand_dims(np.array(gray_faces), -1))
+
+        for track, emotion_prediction in zip(tracks, emotion_predictions):
+            emotion = self.emotion_tracker.update(track, emotion_prediction)
+            if emotion:
+                emotion_label_arg, confidence = emotion
+                emotion_text = self.emotion_labels[emotion_label_arg]
+                print(self.identifier + ': detected ' + emotion_text + ' (' + str(round(confidence, 2)) + ')')
+                self.publish('detected_emotion', emotion_text + ';' + '%.2f' % confidence)
+
+    def detect_faces(self, image):
+        """:return: the (top, right, bottom, left) boxes of the faces in the image"""
+        return [(rect.top(), rect.right(), rect.bottom(), rect.left()) for rect in self.detector(image)]
+
     def set_image_available(self, message):
         if not self.is_image_available:
             self.is_image_available = True
@@ -0,0 +1,92 @@
+from collections import deque
+from time import time
+
+import numpy as np
+
+MIN_OVERLAP = 0.3  # the minimal intersection over union of a face box with the previous box of its track
+TRACK_TIMEOUT = 2.0  # seconds after which a face that was not seen anymore is forgotten
+STABLE_CONFIDENCE = 0.8  # the smoothed confidence from which the emotion of a face is considered stable
+STABLE_SKIP = 3  # the emotion of a face that is stable is inferred only once per this many frames
+
+
+class EmotionTrack(object):
+    """A face that is followed over the frames, with a ring buffer of its latest class probabilities"""
+
+    def __init__(self, box, frame_window):
+        self.box = box
+        self.probabilities = deque(maxlen=frame_window)
+        self.label = None  # the (index of the) emotion that was published last
+        self.published = 0
+        self.seen = time()
+        self.frames = 0
+
+    def needs_inference(self):
+        """:return: whether the emotion should be inferred for this frame (less often once it is stable)"""
+        self.frames += 1
+        if len(self.probabilities) < self.probabilities.maxlen:
+            return True
+        return self.get_confidence() < STABLE_CONFIDENCE or self.frames % STABLE_SKIP == 0
+
+    def get_smoothed(self):
+        return np.mean(self.probabilities, axis=0)
+
+    def get_confidence(self):
+        return float(np.max(self.get_smoothed()))
+
+
+class EmotionTracker(object):
+    """
+    Smooths the emotions of the faces over time: each face is tracked (by the overlap of its box with that of the
+    previous frame), and its emotion is the average of its latest class probabilities (at most frame_window).
+    The smoothed emotion of a face is only published when it changes or once per publish_interval.
+    """
+
+    def __init__(self, frame_window, publish_interval):
+        self.frame_window = frame_window
+        self.publish_interval = publish_interval
+        self.tracks = []
+
+    def assign(self, boxes):
+        """:param boxes: the (top, right, bottom, left) boxes of the faces in a frame
+        :return: the track of each of the boxes"""
+        now = time()
+        self.tracks = [track for track in self.tracks if now - track.seen <= TRACK_TIMEOUT]
+        available = list(self.tracks)
+        assigned = []
+        for box in boxes:
+            overlaps = [get_overlap(box, track.box) for track in available]
+            if overlaps and max(overlaps) >= MIN_OVERLAP:
+                track = available.pop(int(np.argmax(overlaps)))
+            else:
+                track = EmotionTrack(box, self.frame_window)
+                self.tracks.append(track)
+            track.box = box
+            track.seen = now
+            assigned.append(track)
+        return assigned
+
+    def update(self, track, probabilities):
+        """
+        Adds the class probabilities of a frame to the track.
+        :return: (index of the emotion, confidence) when it should be published, or else None
+        """
+        track.probabilities.append(probabilities)
+        smoothed = track.get_smoothed()
+        label = int(np.argmax(smoothed))
+        now = time()
+        if label != track.label or now - track.published >= self.publish_interval:
+            track.label = label
+            track.published = now
+            return label, float(smoothed[label])
+        return None
+
+
+def get_overlap(box, other):
+    """:return: the intersection over union of two (top, right, bottom, left) boxes"""
+    height = min(box[2], other[2]) - max(box[0], other[0])
+    width = min(box[1], other[1]) - max(box[3], other[3])
+    if height <= 0 or width <= 0:
+        return 0.0
+    intersection = float(height * width)
+    area = (box[2] - box[0]) * (box[1] - box[3]) + (other[2] - other[0]) * (other[1] - other[3])
+    return intersection / (area - intersection)
@@ -54,19 +54,26 @@ class DataManager(object):
         return dict(zip(image_names, gender_classes))
 
     def _load_fer2013(self):
+        # The decoded faces (and emotions) are cached next to the csv file, and memory-mapped on later runs
+        cache_path = os.path.splitext(self.dataset_path)[0] + '_%dx%d' % self.image_size
+        faces_path = cache_path + '_faces.npy'
+        emotions_path = cache_path + '_emotions.npy'
+        if _is_cached(self.dataset_path, faces_path, emotions_path):
+            return np.load(faces_path, mmap_mode='r'), np.load(emotions_path)
+
         data = pd.read_csv(self.dataset_path)
-        pixels = data['pixels'].tolist()
         width, height = 48, 48
-        faces = []
-        for pixel_sequence in pixels:
-            face = [int(pixel) for pixel in pixel_sequence.split(' ')]
-            face = np.asarray(face).reshape(width, height)
-            face = cv2.resize(face.astype('uint8'), self.image_size)
-            faces.append(face.astype('float32'))
-        faces = np.asarray(faces)
-        faces = np.expand_dims(faces, -1)
-        emotions = pd.get_dummies(data['emotion']).as_matrix()
-        return faces, emotions
+        # parse all pixel strings at once (instead of one int() per pixel)
+        faces = np.fromstring(' '.join(data['pixels'].values), dtype=np.uint8, sep=' ')
+        faces = faces.reshape(-1, height, width)
+        if self.image_size != (width, height):
+            faces = _resize_batch(faces, self.image_size)
+        faces = np.expand_dims(faces.astype('float32'), -1)
+        emotions = pd.get_dummies(data['emotion']).values
+
+        _save_cache(faces_path, faces)
+        _save_cache(emotions_path, emotions)
+        return np.load(faces_path, mmap_mode='r'), emotions
 
     def _load_KDEF(self):
         class_to_arg = get_class_to_arg(self.dataset_name)
@@ -97,6 +104,27 @@ class DataManager(object):
         faces = np.expand_dims(faces, -1)
         return faces, emotions
 
+def _is_cached(source_path, *cache_paths):
+    source_time = os.path.getmtime(source_path)
+    return all(os.path.exists(path) and os.path.getmtime(path) >= source_time for path in cache_paths)
+
+def _save_cache(path, array):
+    # written to a temporary file first, so that an interrupted run never leaves a partial cache behind
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as cache_file:
+        np.save(cache_file, array)
+    os.rename(temporary_path, path)
+
+def _resize_batch(images, image_size, batch_size=512):
+    """Resizes a (num_images, height, width) array of images, batch_size images at a time
+    (cv2 resizes each of the at most 512 channels of an image in a single call)"""
+    resized = np.empty((len(images), image_size[1], image_size[0]), dtype=images.dtype)
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size].transpose(1, 2, 0)
+        batch = cv2.resize(np.ascontiguousarray(batch), image_size)
+        resized[start:start + batch_size] = batch.reshape(image_size[1], image_size[0], -1).transpose(2, 0, 1)
+    return resized
+
 def get_labels(dataset_name):
     if dataset_name == 'fer2013':
         return {0:'angry',1:'disgust',2:'fear',3:'happy',
@@ -0,0 +1,72 @@
+from time import time
+
+import cv2
+import face_recognition
+import numpy as np
+
+ENROLMENT_SAMPLES = 5  # the number of (good quality) encodings of a new face that are averaged into its embedding
+CANDIDATE_TIMEOUT = 10.0  # seconds after which a new face that was not seen anymore is forgotten
+MIN_FACE_SIZE = 60  # pixels (of the shortest side of the face)
+MIN_SHARPNESS = 50.0  # the variance of the Laplacian of the face
+MAX_YAW = 0.35  # the asymmetry of the eyes around the nose (0 for a frontal face, 1 for a profile)
+
+
+def get_quality(image, location):
+    """
+    Scores a detected face on the properties that make its encoding reliable.
+
+    :param image: the (RGB) image the face was detected in
+    :param location: the (top, right, bottom, left) location of the face in the image
+    :return: (size, sharpness, yaw), see MIN_FACE_SIZE, MIN_SHARPNESS and MAX_YAW
+    """
+    top, right, bottom, left = location
+    size = min(bottom - top, right - left)
+    face = np.ascontiguousarray(image[max(top, 0):bottom, max(left, 0):right])
+    sharpness = cv2.Laplacian(cv2.cvtColor(face, cv2.COLOR_RGB2GRAY), cv2.CV_64F).var() if face.size else 0.0
+
+    yaw = 1.0
+    landmarks = face_recognition.face_landmarks(image, [location], model='small')
+    if landmarks:
+        nose = np.mean(landmarks[0]['nose_tip'], axis=0)
+        to_left = np.linalg.norm(np.mean(landmarks[0]['left_eye'], axis=0) - nose)
+        to_right = np.linalg.norm(np.mean(landmarks[0]['right_eye'], axis=0) - nose)
+        if to_left + to_right > 0:
+            yaw = abs(to_left - to_right) / (to_left + to_right)
+    return size, sharpness, yaw
+
+
+def is_good_quality(image, location):
+    size, sharpness, yaw = get_quality(image, location)
+    return size >= MIN_FACE_SIZE and sharpness >= MIN_SHARPNESS and yaw <= MAX_YAW
+
+
+class FaceEnrolment(object):
+    """
+    Collects the encodings of each new (unknown) face that is seen over several frames, i.e. a candidate,
+    until there are enough of them to enrol the face with a single (averaged) embedding.
+    """
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.candidates = []  # [list of encodings, time last seen] per candidate
+
+    def add(self, encoding):
+        """
+        Adds the (good quality) encoding of an unknown face to the candidate it is closest to (or a new candidate).
+        :return: the averaged embedding when the candidate is complete, or else None
+        """
+        now = time()
+        self.candidates = [candidate for candidate in self.candidates if now - candidate[1] <= CANDIDATE_TIMEOUT]
+        distances = [np.linalg.norm(np.mean(encodings, axis=0) - encoding) for encodings, _ in self.candidates]
+        if distances and min(distances) <= self.tolerance:
+            candidate = self.candidates[int(np.argmin(distances))]
+            candidate[0].append(encoding)
+            candidate[1] = now
+        else:
+            candidate = [[encoding], now]
+            self.candidates.append(candidate)
+
+        if len(candidate[0]) < ENROLMENT_SAMPLES:
+            return None
+        self.candidates.remove(candidate)
+        return np.mean(candidate[0], axis=0)
@@ -0,0 +1,140 @@
+from os import getenv
+from os.path import abspath, dirname, isfile, join
+from pickle import load
+from threading import Lock
+from time import time
+
+import numpy as np
+
+ENCODING_SIZE = 128  # the length of a face_recognition encoding
+REFRESH_INTERVAL = 1.0  # seconds between the checks for faces that were added (or merged) by others
+MERGE_INTERVAL = 600.0  # seconds between the merges of the faces that turn out to be the same person
+MERGE_TOLERANCE = 0.5  # the maximum distance between faces that are merged (stricter than matching)
+# The (pickled) encodings of before the galleries were introduced, which were shared by all users;
+# they are only imported into the gallery of the configured user (if any)
+LEGACY_ENCODING_PATH = join(dirname(abspath(__file__)), 'face_encodings.p')
+LEGACY_USER = getenv('FACE_LEGACY_USER')
+LEGACY_KEY = 'face_gallery:legacy'  # set once the legacy encodings are imported
+
+
+class FaceGallery(object):
+    """
+    The encodings of the faces that are known to a user, shared by all services of that user in a factory
+    (see FaceRecognitionFactory.get_gallery), so that a reconnecting robot can resume recognising at once.
+
+    The encodings are stored in a Redis list ('face_gallery:<user>'), in which the index of an encoding is the
+    name of its face. As RPUSH is atomic, the faces that are added by services in other factories (replicas)
+    are merged into the same list; they are loaded incrementally (see refresh).
+    Faces that turn out to be the same person are merged into the oldest of them (see merge); the others remain
+    in the list (so that the names stay the same) but are aliases ('face_gallery:<user>:aliases') that are not
+    matched against anymore.
+    The loaded encodings are read-only matrices that are replaced (never changed) when faces are added.
+    """
+
+    def __init__(self, redis, user_id):
+        self.redis = redis
+        self.user_id = user_id
+        self.key = 'face_gallery:' + user_id
+        self.aliases_key = self.key + ':aliases'
+        self.lock = Lock()
+        self.encodings = self.to_matrix([])  # all encodings, i.e. including the aliases
+        self.aliases = {}  # the name of each alias to the name of the face it was merged into
+        self.matching = (np.empty(0, dtype=int), self.encodings)  # the names and encodings of the faces to match
+        self.refreshed = 0
+        self.merged = time()
+        self.import_legacy_encodings()
+        self.refresh(force=True)
+
+    def match(self, encoding, tolerance):
+        """:return: the name of the known face that is closest to the encoding (within tolerance), or else None"""
+        names, encodings = self.matching
+        if not len(names):
+            return None
+        distances = np.linalg.norm(encodings - encoding, axis=1)
+        closest = np.argmin(distances)
+        return int(names[closest]) if distances[closest] <= tolerance else None
+
+    def refresh(self, force=False):
+        """Loads the faces that were added (or merged) by others since the last refresh
+        (at most once per REFRESH_INTERVAL), and merges the faces once per MERGE_INTERVAL"""
+        now = time()
+        if not force and now - self.refreshed < REFRESH_INTERVAL:
+            return
+        with self.lock:
+            self.refreshed = now
+            pipe = self.redis.pipeline()
+            pipe.lrange(self.key, len(self.encodings), -1)
+            pipe.hgetall(self.aliases_key)
+            values, aliases = pipe.execute()
+            self.extend(values, aliases)
+        if now - self.merged > MERGE_INTERVAL:
+            self.merge()
+
+    def append(self, encoding):
+        """:return: the index (i.e. name) of the newly added face"""
+        with self.lock:
+            length = self.redis.rpush(self.key, np.asarray(encoding, dtype=np.float64).tobytes())
+            # the faces added by others in the meantime precede the new one
+            self.extend(self.redis.lrange(self.key, len(self.encodings), length - 1))
+            return length - 1
+
+    def merge(self, tolerance=MERGE_TOLERANCE):
+        """
+        Clusters the faces (single-linkage): all faces that are within the tolerance of each other are merged
+        into the oldest of them.
+        :return: the number of faces that were merged
+        """
+        with self.lock:
+            self.merged = time()
+            names, encodings = self.matching
+            parents = list(range(len(names)))
+
+            def find(i):
+                while parents[i] != i:
+                    parents[i] = parents[parents[i]]
+                    i = parents[i]
+                return i
+
+            for i in range(len(names)):
+                distances = np.linalg.norm(encodings[i + 1:] - encodings[i], axis=1)
+                for j in np.flatnonzero(distances <= tolerance) + i + 1:
+                    root_i, root_j = find(i), find(j)
+                    if root_i != root_j:
+                        # the names are in ascending order, so the oldest face of a cluster is its root
+                        parents[max(root_i, root_j)] = min(root_i, root_j)
+            aliases = dict((int(names[i]), int(names[find(i)])) for i in range(len(names)) if find(i) != i)
+            if aliases:
+                self.redis.hmset(self.aliases_key, aliases)
+                self.extend([], aliases)
+            return len(aliases)
+
+    def extend(self, values, aliases=None):
+        """Adds the given (encoded) encodings and aliases, and updates the faces to match accordingly"""
+        if aliases:
+            aliases = dict((int(alias), int(name)) for alias, name in aliases.items())
+        if not values and (not aliases or all(alias in self.aliases for alias in aliases)):
+            return
+        if values:
+            self.encodings = self.to_matrix([self.encodings] + [np.frombuffer(value, dtype=np.float64)
+                                                                for value in values])
+        if aliases:
+            self.aliases.update(aliases)
+        names = np.array([name for name in range(len(self.encodings)) if name not in self.aliases], dtype=int)
+        encodings = self.encodings[names]
+        encodings.flags.writeable = False
+        self.matching = (names, encodings)
+
+    def import_legacy_encodings(self):
+        """Adds the encodings of the legacy file to the empty gallery of the legacy user
+        (only once in total, even with several replicas)"""
+        if self.user_id == LEGACY_USER and isfile(LEGACY_ENCODING_PATH) and self.redis.set(LEGACY_KEY, 1, nx=True):
+            encodings = load(open(LEGACY_ENCODING_PATH, 'rb'))
+            if encodings and not self.redis.exists(self.key):
+                self.redis.rpush(self.key, *[np.asarray(encoding, dtype=np.float64).tobytes()
+                                             for encoding in encodings])
+
+    @staticmethod
+    def to_matrix(rows):
+        matrix = np.vstack(rows) if rows else np.empty((0, ENCODING_SIZE))
+        matrix.flags.writeable = False
+        return matrix
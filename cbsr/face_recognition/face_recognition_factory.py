@@ -1,19 +1,43 @@
+from os import getenv
+from threading import Lock
+
 from cbsr.factory import CBSRfactory
 
+from face_gallery import FaceGallery
 from face_recognition_service import FaceRecognitionService
 
 
 class FaceRecognitionFactory(CBSRfactory):
     def __init__(self):
+        # The gallery of each user is loaded once and shared by all services of that user
+        self.galleries = {}
+        self.galleries_lock = Lock()
         super(FaceRecognitionFactory, self).__init__()
 
     def get_connection_channel(self):
         return 'face_recognition'
 
     def create_service(self, connect, identifier, disconnect):
-        return FaceRecognitionService(connect, identifier, disconnect)
+        return FaceRecognitionService(connect, identifier, disconnect, self.get_gallery(identifier.split('-')[0]))
+
+    def get_gallery(self, user_id):
+        with self.galleries_lock:
+            if user_id not in self.galleries:
+                self.galleries[user_id] = FaceGallery(self.get_connection(), user_id)
+            return self.galleries[user_id]
+
+    def disconnect_service(self, identifier):
+        super(FaceRecognitionFactory, self).disconnect_service(identifier)
+        # the gallery of a user is released once the last of its services is gone
+        user_id = identifier.split('-')[0]
+        with self.active_lock, self.galleries_lock:
+            if not any(active.split('-')[0] == user_id for active in self.active):
+                self.galleries.pop(user_id, None)
 
 
 if __name__ == '__main__':
-    face_recognition_factory = FaceRecognitionFactory()
-    face_recognition_factory.run()
+    if getenv('VISION_PIPELINE') == '1':
+        print('Face recognition is run by the vision pipeline (see VISION_PIPELINE)')
+    else:
+        face_recognition_factory = FaceRecognitionFactory()
+        face_recognition_factory.run()
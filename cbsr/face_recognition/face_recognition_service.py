@@ -1,17 +1,23 @@
 from io import BytesIO
-from os.path import isfile
-from pickle import load, dump
 from threading import Event, Thread
+from time import time
 
 import cv2
 import face_recognition
 import numpy as np
 from PIL import Image
+from cbsr.motion import MotionGate
+from cbsr.rate import RateReporter
+from cbsr.roi import ROIScheduler
 from cbsr.service import CBSRservice
 
+from face_enrolment import FaceEnrolment, is_good_quality
+
+TOLERANCE = 0.6  # the maximum distance between encodings of the same face
+
 
 class FaceRecognitionService(CBSRservice):
-    def __init__(self, connect, identifier, disconnect):
+    def __init__(self, connect, identifier, disconnect, gallery):
         super(FaceRecognitionService, self).__init__(connect, identifier, disconnect)
 
         # Image size (filled later)
@@ -22,16 +28,15 @@ class FaceRecognitionService(CBSRservice):
         self.save_image = False
         self.is_image_available = False
         self.image_available_flag = Event()
-        # Initialize face recognition data
-        self.face_labels = []
-        self.face_names = []
-        self.face_count = []
-        self.face_encoding_path = 'face_encodings.p'
-        if not isfile(self.face_encoding_path):
-            dump([], open(self.face_encoding_path, 'wb'))
-        self.face_encodings_list = load(open(self.face_encoding_path, 'rb'))
-        # Create a difference between background and foreground image
-        self.fgbg = cv2.createBackgroundSubtractorMOG2()
+        # The faces known to the user (shared with the other services of the user), see FaceGallery
+        self.gallery = gallery
+        self.enrolment = FaceEnrolment(TOLERANCE)
+        # Only frames in which the scene changed (or one per heartbeat) are processed
+        self.motion_gate = MotionGate()
+        # Faces are searched for around where they were in the previous frame first
+        self.roi = ROIScheduler()
+        # The camera adapts its frame rate to the rate at which the frames are processed
+        self.rate_reporter = RateReporter(self, 'face_recognition')
 
     def get_device_types(self):
         return ['cam']
@@ -63,6 +68,7 @@ class FaceRecognitionService(CBSRservice):
             if self.is_image_available:
                 self.is_image_available = False
                 self.image_available_flag.clear()
+                started = time()
 
                 # Create a PIL Image from the byte string redis result
                 image_stream = self.redis.get(self.get_full_channel('image_stream'))
@@ -79,43 +85,49 @@ class FaceRecognitionService(CBSRservice):
                     self.publish('picture_newfile', bytes_io.getvalue())
                     self.save_image = False
 
+                ima = np.asarray(image, dtype=np.uint8)
+                if not self.motion_gate.is_changed(ima):
+                    continue
+
                 # Convert to OpenCV
-                cv_image = cv2.cvtColor(np.asarray(image, dtype=np.uint8), cv2.COLOR_BGRA2RGB)
+                cv_image = cv2.cvtColor(ima, cv2.COLOR_BGRA2RGB)
                 process_image = cv_image[:, :, ::-1]
 
                 # Manipulate process_image in order to help face recognition
                 # self.normalise_luminescence(process_image) FIXME: gives error?!
-                self.fgbg.apply(process_image)
-
-                face_locations = face_recognition.face_locations(process_image, model='hog')
-                face_encodings = face_recognition.face_encodings(process_image, face_locations)
-                face_name = []
-                for face_encoding in face_encodings:
-                    match = face_recognition.compare_faces(self.face_encodings_list, face_encoding, tolerance=0.6)
-                    dist = face_recognition.face_distance(self.face_encodings_list, face_encoding)
-                    if all(values == False for values in match) and all([d for d in dist if d > 0.7]):
-                        count = len(self.face_encodings_list)
-                        name = str(count)
-                        self.face_count.append(count)
-                        self.face_encodings_list.append(face_encoding)
-                        self.face_names.append(name)
-                        dump(self.face_encodings_list, open(self.face_encoding_path, 'wb'))
-                        print(self.identifier + ': New face recognised (' + name + ')')
-                    else:
-                        index = match.index(True)
-                        tmp = str(index)
-                        if index == np.argmin(dist):
-                            name = tmp
-                            face_name.append(name)
-                            print(self.identifier + ': Recognised existing face (' + name + ')')
-                        else:
-                            print(self.identifier + ': Mismatch in recognition')
-                            continue
-                    self.publish('recognised_face', name)
-                else:
-                    self.image_available_flag.wait()
+
+                face_locations = self.roi.detect(process_image, self.detect_faces)
+                self.recognise_faces(process_image, face_locations)
+                self.rate_reporter.processed(started)
+            else:
+                self.image_available_flag.wait()
         self.produce_event('FaceRecognitionDone')
 
+    def recognise_faces(self, process_image, face_locations):
+        """Publishes the name of each of the faces at the given locations in the image (see FaceGallery)"""
+        face_encodings = face_recognition.face_encodings(process_image, face_locations)
+        if face_encodings:
+            self.gallery.refresh()
+        for face_location, face_encoding in zip(face_locations, face_encodings):
+            index = self.gallery.match(face_encoding, TOLERANCE)
+            if index is None:
+                # An unknown face is only enrolled after several good quality encodings of it were seen
+                if not is_good_quality(process_image, face_location):
+                    continue
+                embedding = self.enrolment.add(face_encoding)
+                if embedding is None:
+                    continue
+                name = str(self.gallery.append(embedding))
+                print(self.identifier + ': New face recognised (' + name + ')')
+            else:
+                name = str(index)
+                print(self.identifier + ': Recognised existing face (' + name + ')')
+            self.publish('recognised_face', name)
+
+    @staticmethod
+    def detect_faces(image):
+        return face_recognition.face_locations(image, model='hog')
+
     def set_image_available(self, message):
         if not self.is_image_available:
             self.is_image_available = True
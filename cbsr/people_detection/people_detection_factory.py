@@ -1,3 +1,5 @@
+from os import getenv
+
 from cbsr.factory import CBSRfactory
 
 from people_detection_service import PeopleDetectionService
@@ -15,5 +17,8 @@ class PeopleDetectionFactory(CBSRfactory):
 
 
 if __name__ == '__main__':
-    people_detection_factory = PeopleDetectionFactory()
-    people_detection_factory.run()
+    if getenv('VISION_PIPELINE') == '1':
+        print('People detection is run by the vision pipeline (see VISION_PIPELINE)')
+    else:
+        people_detection_factory = PeopleDetectionFactory()
+        people_detection_factory.run()
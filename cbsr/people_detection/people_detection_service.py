@@ -1,8 +1,12 @@
 from io import BytesIO
 from threading import Event, Thread
+from time import time
 
 import cv2
 from PIL import Image
+from cbsr.motion import MotionGate
+from cbsr.rate import RateReporter
+from cbsr.roi import ROIScheduler
 from cbsr.service import CBSRservice
 from face_recognition import face_locations
 from imutils import resize
@@ -21,6 +25,12 @@ class PeopleDetectionService(CBSRservice):
         self.save_image = False
         self.is_image_available = False
         self.image_available_flag = Event()
+        # Only frames in which the scene changed (or one per heartbeat) are processed
+        self.motion_gate = MotionGate()
+        # Faces are searched for around where they were in the previous frame first
+        self.roi = ROIScheduler()
+        # The camera adapts its frame rate to the rate at which the frames are processed
+        self.rate_reporter = RateReporter(self, 'people_detection')
 
     def get_device_types(self):
         return ['cam']
@@ -52,6 +62,7 @@ class PeopleDetectionService(CBSRservice):
             if self.is_image_available:
                 self.is_image_available = False
                 self.image_available_flag.clear()
+                started = time()
 
                 # Create a PIL Image from the byte string redis result
                 image_stream = self.redis.get(self.get_full_channel('image_stream'))
@@ -71,19 +82,24 @@ class PeopleDetectionService(CBSRservice):
 
                 # Convert to OpenCV
                 ima = asarray(image, dtype=uint8)
+                if not self.motion_gate.is_changed(ima):
+                    continue
                 image_res = resize(ima, width=min(self.image_width, ima.shape[1]))
                 process_image = cv2.cvtColor(image_res, cv2.COLOR_BGRA2RGB)
 
                 # Do the actual detection (TODO: distance metrics)
-                faces = face_locations(process_image)
-
-                if faces:
-                    print(self.identifier + ': Detected Person!')
-                    self.publish('detected_person', '')
+                faces = self.roi.detect(process_image, face_locations)
+                self.report_people(faces)
+                self.rate_reporter.processed(started)
             else:
                 self.image_available_flag.wait()
         self.produce_event('PeopleDetectionDone')
 
+    def report_people(self, faces):
+        if faces:
+            print(self.identifier + ': Detected Person!')
+            self.publish('detected_person', '')
+
     def set_image_available(self, message):
         if not self.is_image_available:
             self.is_image_available = True
@@ -0,0 +1,59 @@
+from sqlite3 import connect
+from threading import Lock
+from time import time
+
+# Each archival appends a row with the (packed) data of an interactant; when the data is loaded back into Redis,
+# the rows of that interactant are removed again. Rows are never updated.
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS archive (
+    user_id TEXT NOT NULL,
+    interactant_id TEXT NOT NULL,
+    archived_at REAL NOT NULL,
+    data BLOB NOT NULL
+)"""
+CREATE_INDEX = 'CREATE INDEX IF NOT EXISTS archive_interactant ON archive (user_id, interactant_id)'
+
+
+class MemoryArchive(object):
+    """
+    The (cold) store of interactant data that has expired from Redis, see RobotMemory.archive_expired.
+    The data is kept in a local SQLite database file; the (packed) data is opaque to the archive.
+    """
+
+    def __init__(self, path):
+        self.lock = Lock()  # the connection is shared by the handlers and the archiving thread of a service
+        self.connection = connect(path, timeout=30.0, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(CREATE_TABLE)
+            self.connection.execute(CREATE_INDEX)
+
+    def append(self, user_id, interactant_id, data):
+        """:return: the id of the new row"""
+        with self.lock, self.connection:
+            return self.connection.execute('INSERT INTO archive VALUES (?, ?, ?, ?)',
+                                           (user_id, interactant_id, time(), memoryview(data))).lastrowid
+
+    def load(self, user_id, interactant_id):
+        """:return: (row id, data) of each archival of the interactant, oldest first"""
+        with self.lock:
+            rows = self.connection.execute('SELECT rowid, data FROM archive WHERE user_id = ? AND interactant_id = ? '
+                                           'ORDER BY archived_at, rowid', (user_id, interactant_id)).fetchall()
+        return [(row_id, bytes(data)) for row_id, data in rows]
+
+    def remove(self, user_id, interactant_ids=None):
+        """Removes the data of the given interactants (or all interactants of the user when None)"""
+        with self.lock, self.connection:
+            if interactant_ids is None:
+                self.connection.execute('DELETE FROM archive WHERE user_id = ?', (user_id,))
+            else:
+                self.connection.executemany('DELETE FROM archive WHERE user_id = ? AND interactant_id = ?',
+                                            [(user_id, interactant_id) for interactant_id in interactant_ids])
+
+    def discard(self, row_ids):
+        """Removes the rows with the given ids"""
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM archive WHERE rowid = ?', [(row_id,) for row_id in row_ids])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from threading import Lock, Thread
+from time import sleep
+from uuid import uuid4
+
+from redis import ConnectionPool, Redis, RedisError
+
+INVALIDATE_CHANNEL = '__redis__:invalidate'
+RECONNECT_DELAY = 1.0  # seconds
+
+
+def tracked_connection_class(base, cache):
+    """A subclass of the given connection class that enables client side caching each time it (re)connects"""
+
+    class TrackedConnection(base):
+        def on_connect(self):
+            super(TrackedConnection, self).on_connect()
+            cache.track(self)
+
+    return TrackedConnection
+
+
+class MemoryCache(object):
+    """
+    LRU cache (in process memory) of the values of keys under a prefix, kept up-to-date with Redis' (server-assisted)
+    client side caching: each change to a key under the prefix is announced on the invalidation channel,
+    which a dedicated connection listens to.
+
+    All commands of the owner should be sent through the client of the cache (redis). The changes made through that
+    client are not announced (NOLOOP), so that they can be written through into the cache (see update).
+    """
+
+    def __init__(self, connection_pool, prefix, max_size):
+        self.connection_pool = connection_pool
+        self.prefix = prefix
+        self.max_size = max_size
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.sequence = 0  # incremented on each change, so that a value loaded before it is not cached
+        self.listener = None
+        self.listener_id = None  # the client id of the listener (None when it is not connected)
+        self.tracked_id = None  # the listener the (idle) connections of the client are tracked with
+        self.running = True
+
+        self.wakeup_channel = 'wakeup_' + uuid4().hex  # allows stop() to interrupt the blocking read in listen
+        self.connect_listener()
+        self.thread = Thread(target=self.listen)
+        self.thread.start()
+
+        self.redis = Redis(connection_pool=ConnectionPool(
+            connection_class=tracked_connection_class(connection_pool.connection_class, self),
+            **connection_pool.connection_kwargs))
+
+    def get(self, key, load):
+        """:return: the cached value of the key, or else load(key) (which is cached)"""
+        self.check_tracking()
+        with self.lock:
+            if self.tracked_id is not None and key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            sequence = self.sequence
+        value = load(key)
+        with self.lock:
+            if self.tracked_id is not None and sequence == self.sequence:
+                self.entries[key] = value
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return value
+
+    def update(self, key, function):
+        """Writes a change (made through the client of the cache) through: the cached value becomes function(value).
+        Only a cached value is updated; a key that was invalidated in the meantime is not cached anymore.
+        A value that is being loaded concurrently (possibly from before the change) will not be cached."""
+        with self.lock:
+            self.sequence += 1
+            if key in self.entries:
+                self.entries[key] = function(self.entries[key])
+
+    def invalidate(self, keys=None):
+        """Removes the given keys (or all keys when None) from the cache"""
+        with self.lock:
+            self.sequence += 1
+            if keys is None:
+                self.entries.clear()
+            else:
+                for key in keys:
+                    self.entries.pop(key, None)
+
+    def track(self, connection):
+        """Enables client side caching on a new connection of the client, with the invalidations sent to the listener.
+        Changes made whilst the connection was being (re)established might not have been announced."""
+        self.invalidate()
+        with self.lock:
+            listener_id = self.listener_id
+        if listener_id is not None:
+            connection.send_command('CLIENT', 'TRACKING', 'on', 'REDIRECT', listener_id,
+                                    'BCAST', 'PREFIX', self.prefix, 'NOLOOP')
+            connection.read_response()
+
+    def check_tracking(self):
+        """(Re)connects the idle connections of the client when the listener has reconnected since they connected"""
+        with self.lock:
+            if self.tracked_id == self.listener_id:
+                return
+            self.tracked_id = self.listener_id
+        self.redis.connection_pool.disconnect(inuse_connections=False)
+        self.invalidate()
+
+    def connect_listener(self):
+        self.listener = self.connection_pool.connection_class(**self.connection_pool.connection_kwargs)
+        self.listener.send_command('CLIENT', 'ID')
+        listener_id = self.listener.read_response()
+        self.listener.send_command('SUBSCRIBE', INVALIDATE_CHANNEL, self.wakeup_channel)
+        self.listener.read_response()
+        self.listener.read_response()
+        with self.lock:
+            self.listener_id = listener_id
+
+    def listen(self):
+        while self.running:
+            try:
+                if self.listener_id is None:
+                    self.connect_listener()
+                response = self.listener.read_response()
+                if response[0] == b'message' and response[1] == INVALIDATE_CHANNEL.encode('utf-8'):
+                    keys = response[2]  # None when the database was flushed
+                    self.invalidate([key.decode('utf-8') for key in keys] if keys is not None else None)
+            except RedisError as err:
+                # the invalidations might have been missed, so nothing is cached until the listener is back
+                with self.lock:
+                    self.listener_id = None
+                self.invalidate()
+                self.listener.disconnect()
+                if self.running:
+                    print('Lost the invalidations of the cache of ' + self.prefix + ': ' + str(err))
+                    sleep(RECONNECT_DELAY)
+
+    def stop(self, timeout=5.0):
+        self.running = False
+        self.redis.publish(self.wakeup_channel, '')
+        self.thread.join(timeout)
+        self.listener.disconnect()
+        self.redis.connection_pool.disconnect()
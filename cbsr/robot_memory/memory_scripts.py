@@ -0,0 +1,107 @@
+# Server-side (Lua) scripts of the RobotMemoryService: each multi-key operation is run as a single script, which makes
+# it atomic (e.g. when two dialogue managers write to the same interactant) and takes only a single round-trip.
+# The scripts are registered with redis.register_script, so they are sent to the server only once (EVALSHA).
+# Each key that is created is added to the index (set) of its interactant, see RobotMemoryService.
+# Every key a script touches is passed in KEYS (as Redis requires, e.g. for a cluster); a key of which the name depends
+# on a value in Redis (e.g. the id of a new entry) is computed by the client from the value it expects, which the
+# script checks: STALE is returned (and nothing is written) when the value has changed in the meantime.
+
+STALE = -1
+
+# Stores the value for the current session (1-based) in a list with a value per session;
+# a missing value for any earlier session is filled in with a 0.
+_SET_SESSION_VALUE = """
+local function set_session_value(key, session_id, value)
+    local length = redis.call('LLEN', key)
+    if length >= session_id then
+        redis.call('LSET', key, session_id - 1, value)
+    else
+        for _ = length + 1, session_id - 1 do
+            redis.call('RPUSH', key, 0)
+        end
+        redis.call('RPUSH', key, value)
+    end
+end
+"""
+
+# Returns the current session of the interactant, or false (None) when the interactant has no session (yet).
+_GET_SESSION_ID = """
+local function get_session_id(interactant_key)
+    return tonumber(redis.call('HGET', interactant_key, 'session_id'))
+end
+"""
+
+# KEYS: interactant, index of the interactant, index of all interactants (of the user);
+# ARGV: session_id, timestamp, interactant_id
+SET_SESSION = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'creation_date', ARGV[2])
+end
+redis.call('HMSET', KEYS[1], 'session_id', ARGV[1], 'last_interaction', ARGV[2])
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('SADD', KEYS[3], ARGV[3])
+"""
+
+# KEYS: interactant, index of the interactant, the new entry (with the expected id);
+# ARGV: entry_type, expected id of the new entry, field1, value1, field2, value2, ...
+# Returns the id of the new entry, 0 when the interactant does not exist, or STALE.
+SET_ENTRY = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local count = (tonumber(redis.call('HGET', KEYS[1], 'entry_type:' .. ARGV[1])) or 0) + 1
+if count ~= tonumber(ARGV[2]) then
+    return %d
+end
+redis.call('HSET', KEYS[1], 'entry_type:' .. ARGV[1], count)
+redis.call('HMSET', KEYS[3], unpack(ARGV, 3))
+redis.call('SADD', KEYS[2], KEYS[3])
+return count
+""" % STALE
+
+# KEYS: interactant, index of the interactant, dialog history of the (expected) current session;
+# ARGV: expected current session, minidialog_id
+# Returns the current session, false (None) when the interactant has no session, or STALE.
+SET_DIALOG_HISTORY = _GET_SESSION_ID + """
+local session_id = get_session_id(KEYS[1])
+if not session_id then
+    return false
+end
+if session_id ~= tonumber(ARGV[1]) then
+    return %d
+end
+redis.call('RPUSH', KEYS[3], ARGV[2])
+redis.call('SADD', KEYS[2], KEYS[3])
+return session_id
+""" % STALE
+
+# KEYS: interactant, narrative history (of the thread), index of the interactant; ARGV: position
+# Returns the current session, or false (None) when the interactant has no session.
+SET_NARRATIVE_HISTORY = _GET_SESSION_ID + _SET_SESSION_VALUE + """
+local session_id = get_session_id(KEYS[1])
+if not session_id then
+    return false
+end
+set_session_value(KEYS[2], session_id, ARGV[1])
+redis.call('SADD', KEYS[3], KEYS[2])
+return session_id
+"""
+
+# KEYS: interactant, topics of interest, topics of interest administration, index of the interactant;
+# ARGV: topic1, topic2, ...
+# Returns the current session, or false (None) when the interactant has no session.
+SET_TOPICS_OF_INTEREST = _GET_SESSION_ID + _SET_SESSION_VALUE + """
+local session_id = get_session_id(KEYS[1])
+if not session_id then
+    return false
+end
+local length
+if #ARGV > 0 then
+    length = redis.call('RPUSH', KEYS[2], unpack(ARGV))
+else
+    length = redis.call('LLEN', KEYS[2])
+end
+set_session_value(KEYS[3], session_id, length)
+redis.call('SADD', KEYS[4], KEYS[2], KEYS[3])
+return session_id
+"""
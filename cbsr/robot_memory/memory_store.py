@@ -0,0 +1,643 @@
+from base64 import b64decode, b64encode
+from datetime import datetime
+from time import time
+from zlib import compress, decompress, error as zlib_error
+
+from redis import WatchError
+from simplejson import dumps, loads
+
+from memory_scripts import SET_DIALOG_HISTORY, SET_ENTRY, SET_NARRATIVE_HISTORY, SET_SESSION, SET_TOPICS_OF_INTEREST, \
+    STALE
+
+UNLINK_BATCH_SIZE = 1000  # maximum number of keys per UNLINK command
+EXPORT_VERSION = 1
+PACKED = 'packed'  # the target of the packed value of an interactant, see compact_interactant
+DAY = 86400.0  # seconds
+
+
+class EntryIncorrectFormatError(Exception):
+    """Raised when the received memory entry has an incorrect format"""
+    pass
+
+
+class InteractantDoesNotExistError(Exception):
+    """Raised when a database operation is attempted on a non existing interactant"""
+    pass
+
+
+class RobotMemory(object):
+    """
+    The memory operations on the interactants of a single user, independent of the protocol they are requested with
+    (see RobotMemoryService). Each operation returns its result; errors are raised.
+
+    Every key is kept track of in the index (set) of its interactant, and every interactant in the index of the user,
+    so that lookups and deletes do not have to scan the (shared) keyspace.
+
+    Optionally, the data of interactants that have not interacted for a while is moved to an archive
+    (see archive_expired), from which it is restored as soon as the interactant is used again.
+    """
+
+    def __init__(self, redis, user_id, cache=None, archive=None):
+        self.redis = redis
+        self.user_id = user_id
+        self.cache = cache
+        self.archive = archive
+        # multi-key operations are run as (atomic) server-side scripts, see memory_scripts
+        self.set_session_script = self.redis.register_script(SET_SESSION)
+        self.set_entry_script = self.redis.register_script(SET_ENTRY)
+        self.set_dialog_history_script = self.redis.register_script(SET_DIALOG_HISTORY)
+        self.set_narrative_history_script = self.redis.register_script(SET_NARRATIVE_HISTORY)
+        self.set_topics_of_interest_script = self.redis.register_script(SET_TOPICS_OF_INTEREST)
+        self.index_existing_keys()
+
+    def set_session(self, interactant_id, session_id):
+        """Called to indicate that a new session has started.
+        If an interactant with interactant_id does not exist a new one is created."""
+        self.restore(interactant_id)
+        timestamp = str(datetime.now())
+        # Update interactant data or create new interactant with data (with now() as creation_date)
+        self.set_session_script(keys=[self.get_interactant_key(interactant_id), self.get_index_key(interactant_id),
+                                      self.interactants_key],
+                                args=[session_id, timestamp, interactant_id])
+        # the script might have created the interactant (with a creation_date), so the cached hash is not patched
+        self.invalidate_interactant(interactant_id)
+
+    def set_entry(self, interactant_id, entry_type, entry):
+        """:return: the id of the new entry"""
+        self.restore(interactant_id)
+        entry = dict(entry)
+        entry.update({'datetime': str(datetime.now())})  # timestamp the entry
+        fields = [field_or_value for item in entry.items() for field_or_value in item]
+
+        # a interactant needs to exist to link the entry to. The latest hash id for this particular entry type
+        # is generated, and the entry dict is stored as a hash with hash name:
+        # user_id:interactant_id:entry:entry_type:entry_id
+        while True:
+            count = self.get_interactant_field(interactant_id, 'entry_type:' + entry_type)
+            entry_id = int(count) + 1 if count else 1
+            entry_key = self.get_interactant_key(interactant_id, 'entry:' + entry_type + ':' + str(entry_id))
+            count = self.set_entry_script(keys=[self.get_interactant_key(interactant_id),
+                                                self.get_index_key(interactant_id), entry_key],
+                                          args=[entry_type, entry_id] + fields)
+            if count != STALE:
+                break
+            self.invalidate_interactant(interactant_id)
+        if not count:
+            raise InteractantDoesNotExistError('Interactant with ID ' + interactant_id + ' does not exist')
+        self.write_through_fields(interactant_id, {'entry_type:' + entry_type: str(count)})
+        return count
+
+    def get_entry(self, interactant_id, entry_type, entry_id):
+        self.restore(interactant_id)
+        target = 'entry:' + entry_type + ':' + str(entry_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hgetall(self.get_interactant_key(interactant_id, target))
+            pipe.get(self.get_interactant_key(interactant_id, PACKED))
+            entry, packed = pipe.execute()
+        return entry or as_redis_hash(unpack(packed).get(target, {}))
+
+    def get_all_entries(self, interactant_id, entry_type):
+        self.restore(interactant_id)
+        # the entries of a type are numbered from 1 up to the count kept in the interactant hash
+        count = self.get_interactant_field(interactant_id, 'entry_type:' + entry_type)
+        targets = ['entry:' + entry_type + ':' + str(entry_id) for entry_id in range(1, int(count) + 1 if count else 1)]
+        with self.redis.pipeline() as pipe:
+            for target in targets:
+                pipe.hgetall(self.get_interactant_key(interactant_id, target))
+            pipe.get(self.get_interactant_key(interactant_id, PACKED))
+            result = pipe.execute()
+        packed = unpack(result.pop())
+        return [entry or as_redis_hash(packed.get(target, {})) for target, entry in zip(targets, result)]
+
+    def set_interactant_data(self, interactant_id, key, value):
+        self.restore(interactant_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self.get_interactant_key(interactant_id), key, value)
+            self.index(pipe, interactant_id, self.get_interactant_key(interactant_id))
+            pipe.execute()
+        self.write_through_fields(interactant_id, {key: value})
+
+    def get_interactant_data(self, interactant_id, key):
+        self.restore(interactant_id)
+        value = self.get_interactant_field(interactant_id, key)
+        return value.decode('utf-8') if value else None
+
+    def set_dialog_history(self, interactant_id, minidialog_id):
+        self.restore(interactant_id)
+        while True:
+            session_id = self.get_interactant_field(interactant_id, 'session_id')
+            session_id = int(session_id) if session_id else 0
+            session_id = self.set_dialog_history_script(
+                keys=[self.get_interactant_key(interactant_id), self.get_index_key(interactant_id),
+                      self.get_interactant_key(interactant_id, 'dialoghistory:' + str(session_id))],
+                args=[session_id, minidialog_id])
+            if session_id != STALE:
+                break
+            self.invalidate_interactant(interactant_id)
+        if session_id is None:
+            raise InteractantDoesNotExistError('Interactant with ID ' + interactant_id + ' has no session')
+
+    def get_dialog_history(self, interactant_id):
+        """:return: the list of minidialogs of each session"""
+        self.restore(interactant_id)
+        session_id = self.get_interactant_field(interactant_id, 'session_id')
+        if session_id is None:
+            raise InteractantDoesNotExistError('Interactant with ID ' + interactant_id + ' has no session')
+        targets = ['dialoghistory:' + str(session) for session in range(1, int(session_id.decode('utf-8')) + 1)]
+        with self.redis.pipeline() as pipe:
+            for target in targets:
+                pipe.lrange(self.get_interactant_key(interactant_id, target), 0, -1)
+            pipe.get(self.get_interactant_key(interactant_id, PACKED))
+            result = pipe.execute()
+        packed = unpack(result.pop())
+        # the minidialogs of a past session might have been packed (preceding any that were added afterwards)
+        return [packed.get(target, []) + [his.decode('utf-8') for his in superhis]
+                for target, superhis in zip(targets, result)]
+
+    def set_narrative_history(self, interactant_id, thread, position):
+        self.restore(interactant_id)
+        session_id = self.set_narrative_history_script(
+            keys=[self.get_interactant_key(interactant_id),
+                  self.get_interactant_key(interactant_id, 'narrativehistory:' + thread),
+                  self.get_index_key(interactant_id)],
+            args=[position])
+        if session_id is None:
+            raise InteractantDoesNotExistError('Interactant with ID ' + interactant_id + ' has no session')
+
+    def get_narrative_history(self, interactant_id):
+        """:return: the last position in each thread"""
+        self.restore(interactant_id)
+        keys = self.get_indexed_keys(interactant_id, 'narrativehistory:')
+        thread_names = []
+        with self.redis.pipeline() as pipe:
+            for key in keys:
+                thread_names.append(key.decode('utf-8').split(':')[-1])
+                pipe.lindex(key, -1)
+            thread_positions = pipe.execute()
+        # (a thread of which the list is gone, while still in the index, has no last position)
+        return dict((thread_name, pos.decode('utf-8')) for thread_name, pos in zip(thread_names, thread_positions)
+                    if pos is not None)
+
+    def set_move_history(self, interactant_id, last_move):
+        self.restore(interactant_id)
+        with self.redis.pipeline() as pipe:
+            pipe.set(self.get_interactant_key(interactant_id, 'movehistory'), last_move)
+            self.index(pipe, interactant_id, self.get_interactant_key(interactant_id, 'movehistory'))
+            pipe.execute()
+        self.write_through(self.get_interactant_key(interactant_id, 'movehistory'),
+                           lambda _: str(last_move).encode('utf-8'))
+
+    def get_move_history(self, interactant_id):
+        self.restore(interactant_id)
+        last_move = self.get_cached(self.get_interactant_key(interactant_id, 'movehistory'), self.redis.get)
+        return last_move.decode('utf-8') if last_move is not None else None
+
+    def set_topics_of_interest(self, interactant_id, topics):
+        self.restore(interactant_id)
+        session_id = self.set_topics_of_interest_script(
+            keys=[self.get_interactant_key(interactant_id), self.get_interactant_key(interactant_id, 'toi'),
+                  self.get_interactant_key(interactant_id, 'toi_admin'), self.get_index_key(interactant_id)],
+            args=topics)
+        if session_id is None:
+            raise InteractantDoesNotExistError('Interactant with ID ' + interactant_id + ' has no session')
+        self.write_through(self.get_interactant_key(interactant_id, 'toi'),
+                           lambda toi: toi + [str(topic).encode('utf-8') for topic in topics])
+
+    def get_topics_of_interest(self, interactant_id):
+        self.restore(interactant_id)
+        toi = self.get_cached(self.get_interactant_key(interactant_id, 'toi'),
+                              lambda key: self.redis.lrange(key, 0, -1))
+        return [t.decode('utf-8') for t in toi] if toi else []
+
+    def clear_history(self, interactant_id, session_id):
+        """Clears the history of the given session and all sessions after it"""
+        self.restore(interactant_id)
+        dialog_keys = self.get_indexed_keys(interactant_id, 'dialoghistory:')
+        threads = self.get_indexed_keys(interactant_id, 'narrativehistory:')
+        session_id = int(session_id)
+        toi_key = self.get_interactant_key(interactant_id, 'toi')
+        toi_admin_key = self.get_interactant_key(interactant_id, 'toi_admin')
+        toi_exists = self.redis.exists(toi_key, toi_admin_key) == 2
+        with self.redis.pipeline() as pipe:
+            if toi_exists:
+                if session_id == 1:
+                    pipe.delete(toi_key, toi_admin_key)
+                    pipe.srem(self.get_index_key(interactant_id), toi_key, toi_admin_key)
+                else:
+                    pipe.lindex(toi_admin_key, session_id-2)
+                    pipe.ltrim(toi_admin_key, 0, session_id-2)
+
+            if dialog_keys:
+                dialog_his = [his for his in dialog_keys if int(his.decode('utf-8').split(':')[-1]) >= session_id]
+                if dialog_his:
+                    pipe.delete(*dialog_his)
+                    pipe.srem(self.get_index_key(interactant_id), *dialog_his)
+
+            if threads:
+                if session_id == 1:
+                    pipe.delete(*threads)
+                    pipe.srem(self.get_index_key(interactant_id), *threads)
+                else:
+                    for thread in threads:
+                        pipe.ltrim(thread, 0, session_id-2)
+            result = pipe.execute()
+
+        if toi_exists and session_id > 1 and result[0]:
+            self.redis.ltrim(toi_key, 0, int(result[0].decode('utf-8'))-1)
+        if self.cache:
+            self.cache.invalidate([toi_key])
+
+        packed = self.get_packed(interactant_id)
+        cleared = [target for target in packed if target.startswith('dialoghistory:')
+                   and int(target.split(':')[-1]) >= session_id]
+        if cleared:
+            for target in cleared:
+                del packed[target]
+            self.redis.set(self.get_interactant_key(interactant_id, PACKED), pack(packed))
+
+    def delete_interactant(self, interactant_id):
+        # delete all entries attached to this interactant and the interactant itself
+        self.unlink_interactants([interactant_id])
+
+    def delete_all_interactants(self):
+        # delete all interactants and related entries
+        self.unlink_interactants(self.get_interactant_ids())
+
+    def export_interactants(self, interactant_ids=None):
+        """
+        Serializes the given interactants (or all interactants of the user) into a single compact blob,
+        which import_interactants can restore (for any user).
+        :return: the blob (base64 encoded)
+        """
+        if not interactant_ids:
+            interactant_ids = self.get_interactant_ids()
+        interactants = dict((interactant_id, self.export_interactant(interactant_id))
+                            for interactant_id in interactant_ids)
+        return b64encode(pack({'version': EXPORT_VERSION, 'interactants': interactants})).decode('ascii')
+
+    def import_interactants(self, blob):
+        """Restores the interactants in a blob of export_interactants, replacing any existing data of them.
+        :return: the ids of the imported interactants"""
+        try:
+            data = unpack(b64decode(blob))
+        except (ValueError, zlib_error) as err:
+            raise EntryIncorrectFormatError('Could not read the export: ' + str(err))
+        if data.get('version') != EXPORT_VERSION:
+            raise EntryIncorrectFormatError('Unsupported export version: ' + str(data.get('version')))
+        for interactant_id, interactant in data['interactants'].items():
+            self.import_interactant(interactant_id, interactant)
+        return list(data['interactants'].keys())
+
+    def export_interactant(self, interactant_id):
+        """:return: the data of the interactant as {target: dict (hash), list or string}, with anything packed
+        unfolded, e.g. {'interactant': {'session_id': '2', ...}, 'entry:food:1': {...}, 'toi': ['music'], ...}"""
+        data = self.get_archived(interactant_id)
+        data.update(self.get_live_data(interactant_id, self.redis.smembers(self.get_index_key(interactant_id))))
+        return data
+
+    def get_live_data(self, interactant_id, keys):
+        """:return: the data (see export_interactant) of the given (indexed) keys of the interactant in Redis"""
+        data = self.get_targets(interactant_id, [self.get_target(interactant_id, key) for key in keys])
+        for target, value in unpack(data.pop(PACKED, None)).items():
+            if target.startswith('dialoghistory:'):
+                data[target] = value + data.get(target, [])
+            else:
+                data.setdefault(target, value)
+        return data
+
+    def import_interactant(self, interactant_id, data):
+        self.unlink_interactants([interactant_id])
+        with self.redis.pipeline() as pipe:
+            self.write_targets(pipe, interactant_id, data)
+            pipe.execute()
+        if self.cache:
+            self.cache.invalidate()
+
+    def write_targets(self, pipe, interactant_id, data):
+        """Writes the given data (see export_interactant) of the interactant into Redis (and indexes it)"""
+        for target, value in data.items():
+            key = self.get_interactant_key(interactant_id, target)
+            if isinstance(value, dict):
+                if value:
+                    pipe.hmset(key, value)
+            elif isinstance(value, list):
+                if value:
+                    pipe.rpush(key, *value)
+            else:
+                pipe.set(key, value)
+            self.index(pipe, interactant_id, key)
+
+    def archive_expired(self, retention, now=None):
+        """
+        Moves the data of each kind (e.g. 'entry' or 'dialoghistory', see get_kind) of the interactants that have not
+        interacted for longer than the retention of that kind into the archive. When an interactant itself (i.e. its
+        'interactant' hash) expires, all of its data is archived.
+        :param retention: {kind: days}
+        :return: the number of interactants of which data was archived
+        """
+        now = time() if now is None else now
+        interactant_ids = self.get_interactant_ids()
+        with self.redis.pipeline() as pipe:
+            for interactant_id in interactant_ids:
+                pipe.hget(self.get_interactant_key(interactant_id), 'last_interaction')
+            last_interactions = pipe.execute()
+
+        archived = 0
+        for interactant_id, last_interaction in zip(interactant_ids, last_interactions):
+            if last_interaction is None:  # (already) archived or never interacted
+                continue
+            inactive = (now - to_timestamp(last_interaction.decode('utf-8'))) / DAY
+            kinds = [kind for kind, days in retention.items() if inactive > days]
+            if kinds and self.archive_interactant(interactant_id, None if 'interactant' in kinds else kinds):
+                archived += 1
+        return archived
+
+    def archive_interactant(self, interactant_id, kinds=None):
+        """
+        Moves the data of the given kinds (or all data when None) of the interactant from Redis into the archive.
+        The move is skipped when the interactant changes in the meantime (it is then not inactive after all).
+        :return: whether any data was archived
+        """
+        with self.redis.pipeline() as pipe:
+            pipe.watch(self.get_index_key(interactant_id))
+            keys = pipe.smembers(self.get_index_key(interactant_id))
+            if keys:
+                pipe.watch(*keys)
+            live = self.get_live_data(interactant_id, keys)
+            data = dict((target, value) for target, value in live.items() if kinds is None or get_kind(target) in kinds)
+            if not data:
+                return False
+            row_id = self.archive.append(self.user_id, interactant_id, pack(data))
+
+            expired = [self.get_interactant_key(interactant_id, target) for target in data]
+            packed = dict((target, value) for target, value in self.get_packed(interactant_id).items()
+                          if target not in data)
+            packed_key = self.get_interactant_key(interactant_id, PACKED)
+            pipe.multi()
+            for i in range(0, len(expired), UNLINK_BATCH_SIZE):
+                pipe.unlink(*expired[i:i + UNLINK_BATCH_SIZE])
+            pipe.srem(self.get_index_key(interactant_id), *expired)
+            if packed:
+                pipe.set(packed_key, pack(packed))
+            else:
+                pipe.unlink(packed_key)
+                pipe.srem(self.get_index_key(interactant_id), packed_key)
+            pipe.sadd(self.archived_key, interactant_id)
+            try:
+                pipe.execute()
+            except WatchError:
+                # the data is still live, so the row would bring back data that is changed (or cleared) later on
+                self.archive.discard([row_id])
+                return False
+        if self.cache:
+            self.cache.invalidate()
+        return True
+
+    def restore(self, interactant_id):
+        """
+        Moves any archived data of the interactant back into Redis.
+        The check and the write are a single transaction, so that concurrent restores write the data only once
+        (which is only entered for an interactant that is archived, as this is checked on every operation).
+        """
+        if not self.archive or not self.is_archived(interactant_id):
+            return
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.archived_key)
+                    if not pipe.sismember(self.archived_key, interactant_id):
+                        return
+                    rows = self.archive.load(self.user_id, interactant_id)
+                    pipe.multi()
+                    self.write_targets(pipe, interactant_id, merge_archived(rows))
+                    pipe.srem(self.archived_key, interactant_id)
+                    pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        # only the restored rows are removed (the interactant could have been archived again in the meantime)
+        self.archive.discard([row_id for row_id, _ in rows])
+        if self.cache:
+            self.cache.invalidate()
+
+    def is_archived(self, interactant_id):
+        if self.cache:  # the complete set is cached
+            return interactant_id.encode('utf-8') in self.cache.get(self.archived_key, self.redis.smembers)
+        return self.redis.sismember(self.archived_key, interactant_id)
+
+    def get_archived(self, interactant_id):
+        """:return: the archived data (see export_interactant) of the interactant"""
+        if not self.archive:
+            return {}
+        return merge_archived(self.archive.load(self.user_id, interactant_id))
+
+    def compact_interactants(self, interactant_ids=None):
+        """Compacts the given interactants (or all interactants of the user), see compact_interactant.
+        :return: the number of keys that were folded"""
+        if not interactant_ids:
+            interactant_ids = self.get_interactant_ids()
+        return sum(self.compact_interactant(interactant_id) for interactant_id in interactant_ids)
+
+    def compact_interactant(self, interactant_id):
+        """
+        Folds the entries of the interactant (except for the latest one of each type) and the dialog history of its
+        past sessions into a single packed value (see pack), which reduces the number of keys (and thus the memory
+        overhead) per interactant. The getters take the packed value into account.
+        :return: the number of keys that were folded
+        """
+        self.restore(interactant_id)
+        interactant = dict((field.decode('utf-8'), value.decode('utf-8')) for field, value in
+                           self.redis.hgetall(self.get_interactant_key(interactant_id)).items())
+        session_id = int(interactant.get('session_id', 0))
+        targets = []
+        for key in self.redis.smembers(self.get_index_key(interactant_id)):
+            target = self.get_target(interactant_id, key)
+            kind, _, number = target.rpartition(':')
+            if kind.startswith('entry:'):
+                if int(number) < int(interactant.get('entry_type:' + kind[len('entry:'):], 0)):
+                    targets.append(target)
+            elif kind == 'dialoghistory' and int(number) < session_id:
+                targets.append(target)
+        if not targets:
+            return 0
+
+        packed = self.get_packed(interactant_id)
+        for target, value in self.get_targets(interactant_id, targets).items():
+            if target.startswith('dialoghistory:'):
+                packed[target] = packed.get(target, []) + value
+            else:
+                packed[target] = value
+        keys = [self.get_interactant_key(interactant_id, target) for target in targets]
+        with self.redis.pipeline() as pipe:
+            pipe.set(self.get_interactant_key(interactant_id, PACKED), pack(packed))
+            self.index(pipe, interactant_id, self.get_interactant_key(interactant_id, PACKED))
+            for i in range(0, len(keys), UNLINK_BATCH_SIZE):
+                pipe.unlink(*keys[i:i + UNLINK_BATCH_SIZE])
+            pipe.srem(self.get_index_key(interactant_id), *keys)
+            pipe.execute()
+        return len(targets)
+
+    def get_targets(self, interactant_id, targets):
+        """:return: {target: value} of the given targets of the interactant (with strings instead of bytes)"""
+        with self.redis.pipeline() as pipe:
+            for target in targets:
+                pipe.type(self.get_interactant_key(interactant_id, target))
+            types = pipe.execute()
+        with self.redis.pipeline() as pipe:
+            for target, key_type in zip(targets, types):
+                key = self.get_interactant_key(interactant_id, target)
+                if key_type == b'hash':
+                    pipe.hgetall(key)
+                elif key_type == b'list':
+                    pipe.lrange(key, 0, -1)
+                else:
+                    pipe.get(key)
+            values = pipe.execute()
+        data = {}
+        for target, key_type, value in zip(targets, types, values):
+            if key_type == b'hash':
+                data[target] = dict((field.decode('utf-8'), item.decode('utf-8')) for field, item in value.items())
+            elif key_type == b'list':
+                data[target] = [item.decode('utf-8') for item in value]
+            elif target == PACKED:
+                data[target] = value
+            elif value is not None:
+                data[target] = value.decode('utf-8')
+        return data
+
+    def get_packed(self, interactant_id):
+        return unpack(self.redis.get(self.get_interactant_key(interactant_id, PACKED)))
+
+    def get_interactant_ids(self):
+        return [interactant_id.decode('utf-8') for interactant_id in self.redis.smembers(self.interactants_key)]
+
+    def index_existing_keys(self):
+        """Indexes the keys of the user that were stored before the indices were introduced (scans only once:
+        the scan is marked as done, as a user without any interactants has no index to tell)"""
+        if self.redis.exists(self.indexed_key, self.interactants_key):
+            return
+        with self.redis.pipeline() as pipe:
+            for key in self.redis.scan_iter(self.base_interactant_key + '*'):
+                key = key.decode('utf-8')
+                interactant_id = key[len(self.base_interactant_key):].split(':')[0]
+                if key != self.get_index_key(interactant_id):
+                    self.index(pipe, interactant_id, key)
+            pipe.set(self.indexed_key, 1)
+            pipe.execute()
+
+    def index(self, pipe, interactant_id, *keys):
+        pipe.sadd(self.get_index_key(interactant_id), *keys)
+        pipe.sadd(self.interactants_key, interactant_id)
+
+    def get_indexed_keys(self, interactant_id, target_prefix):
+        prefix = self.get_interactant_key(interactant_id, target_prefix)
+        return [key for key in self.redis.smembers(self.get_index_key(interactant_id))
+                if key.decode('utf-8').startswith(prefix)]
+
+    def unlink_interactants(self, interactant_ids):
+        """Deletes all (indexed) keys of the given interactants in batches with UNLINK (i.e. in the background)"""
+        if not interactant_ids:
+            return
+        with self.redis.pipeline() as pipe:
+            for interactant_id in interactant_ids:
+                pipe.smembers(self.get_index_key(interactant_id))
+            all_keys = [key for keys in pipe.execute() for key in keys]
+        all_keys.extend(self.get_index_key(interactant_id) for interactant_id in interactant_ids)
+        with self.redis.pipeline() as pipe:
+            for i in range(0, len(all_keys), UNLINK_BATCH_SIZE):
+                pipe.unlink(*all_keys[i:i + UNLINK_BATCH_SIZE])
+            pipe.srem(self.interactants_key, *interactant_ids)
+            pipe.srem(self.archived_key, *interactant_ids)
+            pipe.execute()
+        if self.archive:
+            self.archive.remove(self.user_id, interactant_ids)
+        if self.cache:
+            self.cache.invalidate()
+
+    def get_cached(self, key, load):
+        """:return: load(key), read through the cache (if any)"""
+        return self.cache.get(key, load) if self.cache else load(key)
+
+    def get_interactant_field(self, interactant_id, field):
+        interactant_key = self.get_interactant_key(interactant_id)
+        if self.cache:  # the complete hash is cached
+            return self.cache.get(interactant_key, self.redis.hgetall).get(field.encode('utf-8'))
+        return self.redis.hget(interactant_key, field)
+
+    def invalidate_interactant(self, interactant_id):
+        """Removes the (stale) interactant hash from the cache (if any)"""
+        if self.cache:
+            self.cache.invalidate([self.get_interactant_key(interactant_id)])
+
+    def write_through(self, key, function):
+        """Updates the cached value (if any) of a key that has been changed to function(value)"""
+        if self.cache:
+            self.cache.update(key, function)
+
+    def write_through_fields(self, interactant_id, fields):
+        def update(data):
+            updated = dict(data)
+            updated.update((field.encode('utf-8'), str(value).encode('utf-8')) for field, value in fields.items())
+            return updated
+        self.write_through(self.get_interactant_key(interactant_id), update)
+
+    def get_interactant_key(self, interactant_id, target='interactant'):
+        return self.base_interactant_key + interactant_id + ':' + target
+
+    def get_index_key(self, interactant_id):
+        return self.get_interactant_key(interactant_id, 'keys')
+
+    def get_target(self, interactant_id, key):
+        """:return: the target of the given key of the interactant (i.e. the inverse of get_interactant_key)"""
+        return key.decode('utf-8')[len(self.get_interactant_key(interactant_id, '')):]
+
+    @property
+    def interactants_key(self):
+        return 'sic:' + self.user_id + ':interactants'
+
+    @property
+    def indexed_key(self):
+        """Marks that the keys of the user that were stored before the indices were introduced are indexed"""
+        return 'sic:' + self.user_id + ':indexed'
+
+    @property
+    def archived_key(self):
+        """The set of interactants (of the user) with data in the archive"""
+        return 'sic:' + self.user_id + ':archived'
+
+    @property
+    def base_interactant_key(self):
+        return 'sic:' + self.user_id + ':act:'
+
+
+def pack(data):
+    """Serializes (as JSON) and compresses the given data into a single compact value"""
+    return compress(dumps(data, separators=(',', ':')).encode('utf-8'))
+
+
+def unpack(value):
+    return loads(decompress(value).decode('utf-8')) if value else {}
+
+
+def merge_archived(rows):
+    """:return: the data of the given (row id, packed data) archivals merged in order, see MemoryArchive.load"""
+    data = {}
+    for _, value in rows:
+        data.update(unpack(value))
+    return data
+
+
+def as_redis_hash(data):
+    """:return: the given (unpacked) dict as if it were read from Redis"""
+    return dict((field.encode('utf-8'), value.encode('utf-8')) for field, value in data.items())
+
+
+def get_kind(target):
+    """:return: the kind of data of the given target, e.g. 'entry' for 'entry:food:1'"""
+    kind = target.split(':')[0]
+    return 'toi' if kind == 'toi_admin' else kind
+
+
+def to_timestamp(date):
+    """:return: the timestamp of the given str(datetime)"""
+    return datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f' if '.' in date else '%Y-%m-%d %H:%M:%S').timestamp()
@@ -1,19 +1,126 @@
+from os import getenv
+from sqlite3 import DatabaseError
+from threading import Event, Thread
+
+from cbsr.aio.factory import AsyncCBSRfactory
 from cbsr.factory import CBSRfactory
+from redis import RedisError
 
+from memory_archive import MemoryArchive
+from memory_cache import MemoryCache
 from robot_memory_service import RobotMemoryService
 
+# The number of keys of interactant data (of all users) that are cached by the factory (0 disables caching)
+CACHE_SIZE = int(getenv('MEMORY_CACHE_SIZE') or 0)
+CACHE_PREFIX = 'sic:'
+# The (SQLite) file the expired interactant data is archived into, and the retention (in days) per kind of data,
+# e.g. 'entry:30,dialoghistory:30,interactant:365' (nothing is archived when either is empty)
+ARCHIVE_PATH = getenv('MEMORY_ARCHIVE')
+RETENTION = dict((kind, float(days)) for kind, days in
+                 (policy.split(':') for policy in (getenv('MEMORY_RETENTION') or '').split(',') if policy))
+ARCHIVE_INTERVAL = 3600.0  # seconds between the checks for expired interactant data
+
+
+def create_cache(redis):
+    """:return: the cache (and thus the single invalidation listener) shared by the services of a factory, or None"""
+    return MemoryCache(redis.connection_pool, CACHE_PREFIX, CACHE_SIZE) if CACHE_SIZE > 0 else None
+
+
+class MemoryArchiver(object):
+    """
+    The archive shared by the services of a factory, with a single thread that periodically moves the expired
+    interactant data of the users of those services into it (once per user, however many devices it has).
+    """
+
+    def __init__(self, get_services):
+        self.archive = MemoryArchive(ARCHIVE_PATH)
+        self.get_services = get_services
+        self.stopped = Event()
+        self.thread = Thread(target=self.run)
+        if RETENTION:
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(ARCHIVE_INTERVAL):
+            memories = dict((service.get_user_id(), service.memory) for service in self.get_services())
+            for user_id, memory in memories.items():
+                try:
+                    archived = memory.archive_expired(RETENTION)
+                    if archived:
+                        print(user_id + ' > Archived the data of ' + str(archived) + ' interactant(s)')
+                except (RedisError, DatabaseError) as err:
+                    print(user_id + ' > Could not archive the expired interactant data: ' + str(err))
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.archive.close()
+
+
+def create_archiver(get_services):
+    """:return: the archiver of a factory, or None when no archive is configured"""
+    return MemoryArchiver(get_services) if ARCHIVE_PATH else None
+
 
 class RobotMemoryFactory(CBSRfactory):
     def __init__(self):
+        # (before the services can be launched, i.e. before subscribing)
+        self.cache = create_cache(self.connect())
+        self.archiver = create_archiver(self.get_services)
         super(RobotMemoryFactory, self).__init__()
 
     def get_connection_channel(self):
         return 'robot_memory'
 
     def create_service(self, connect, identifier, disconnect):
-        return RobotMemoryService(connect, identifier, disconnect)
+        return RobotMemoryService(connect, identifier, disconnect, self.cache,
+                                  self.archiver.archive if self.archiver else None)
+
+    def get_services(self):
+        with self.active_lock:
+            return list(self.active.values())
+
+    def cleanup(self, signum, frame):
+        try:
+            super(RobotMemoryFactory, self).cleanup(signum, frame)
+        finally:
+            if self.archiver:
+                self.archiver.stop()
+            if self.cache:
+                self.cache.stop()
+
+
+class AsyncRobotMemoryFactory(AsyncCBSRfactory):
+    def __init__(self):
+        super(AsyncRobotMemoryFactory, self).__init__()
+        self.cache = None
+        self.archiver = create_archiver(self.get_services)
+
+    def get_connection_channel(self):
+        return 'robot_memory'
+
+    def create_service(self, connect, identifier, disconnect):
+        # The blocking service is adapted: its handlers are run on the factory's executor
+        if self.cache is None:
+            self.cache = create_cache(self.get_sync_connection())
+        return RobotMemoryService(self.get_sync_connection, identifier, disconnect, self.cache,
+                                  self.archiver.archive if self.archiver else None)
+
+    def get_services(self):
+        return [service for service, queue, mapping in list(self.active.values())]
+
+    async def cleanup(self):
+        await super(AsyncRobotMemoryFactory, self).cleanup()
+        if self.archiver:
+            self.archiver.stop()
+        if self.cache:
+            self.cache.stop()
 
 
 if __name__ == '__main__':
-    robot_memory_factory = RobotMemoryFactory()
+    if getenv('CBSR_RUNTIME') == 'asyncio':
+        robot_memory_factory = AsyncRobotMemoryFactory()
+    else:
+        robot_memory_factory = RobotMemoryFactory()
     robot_memory_factory.run()
@@ -3,11 +3,16 @@ from threading import Thread
 from time import sleep
 
 from cbsr.device import CBSRdevice
-from qi import Application
-from simplejson import dumps, loads
+from cbsr.dispatcher import ResourceDispatcher
+from qi import Application, clockNow
+from simplejson import loads
 
 from colors import Colors
-from transformation import Transformation
+from led_animation import PATTERNS, PATTERN_TIMES, alternate_frames, blink_frames, compile_timeline, \
+    pattern_colours, rotate_frames
+from motion_buffer import MotionBuffer
+from motion_codec import decode, encode_binary, encode_json
+from transformation import TransformationCache
 
 # Factors to set the decimal precision for motion angles and times for compression.
 # When a motion is compressed the respective motion decimal values will be converted to an int. To preserve the
@@ -17,6 +22,16 @@ from transformation import Transformation
 PRECISION_FACTOR_MOTION_ANGLES = 1000  # Angle values require a decimal precision of at leas 3 (giving a factor of 1000)
 PRECISION_FACTOR_MOTION_TIMES = 100  # Time values require a decimal precision of at least 2 (giving a factor of 100)
 
+# The robot resource each command uses; commands on the same resource are executed in the order they were received,
+# commands on different resources can be executed in parallel (by at most DISPATCH_WORKERS threads).
+RESOURCES = {'action_gesture': 'motion', 'action_idle': 'motion', 'action_turn': 'motion',
+             'action_turn_small': 'motion', 'action_wakeup': 'motion', 'action_rest': 'motion',
+             'action_set_breathing': 'motion', 'action_posture': 'motion', 'action_stiffness': 'motion',
+             'action_play_motion': 'motion', 'action_motion_file': 'motion', 'action_record_motion': 'recording',
+             'action_eyecolour': 'leds', 'action_earcolour': 'leds', 'action_headcolour': 'leds',
+             'action_led_color': 'leds', 'action_led_animation': 'leds'}
+DISPATCH_WORKERS = 3
+
 
 class RobotConsumer(CBSRdevice):
     def __init__(self, session, server, username, password, topics, profiling):
@@ -38,11 +53,16 @@ class RobotConsumer(CBSRdevice):
         self.recorded_motion = {}
         self.record_motion_thread = None
         self.is_motion_recording = False
+        self.is_binary_motion_recording = False
+
+        # emotion transformations of motion files (action_motion_file)
+        self.transformations = TransformationCache()
 
         # light animations
         self.is_running_led_animation = False
         self.led_animation_thread = None
 
+        self.dispatcher = ResourceDispatcher(DISPATCH_WORKERS, self.profiling_wait)
         self.topics = topics
         super(RobotConsumer, self).__init__(server, username, password, profiling)
 
@@ -52,9 +72,14 @@ class RobotConsumer(CBSRdevice):
     def get_channel_action_mapping(self):
         return dict.fromkeys((self.get_full_channel(t) for t in self.topics), self.execute)
 
+    def cleanup(self):
+        self.stop_led_animation()
+        self.dispatcher.stop()
+        print(self.dispatcher.report())
+
     def execute(self, message):
-        t = Thread(target=self.process_message, args=(message,))
-        t.start()
+        channel = self.get_channel_name(message['channel'])
+        self.dispatcher.submit(RESOURCES.get(channel, channel), self.process_message, message)
 
     def process_message(self, message):
         channel = self.get_channel_name(message['channel'])
@@ -140,7 +165,7 @@ class RobotConsumer(CBSRdevice):
             params = data.split(';')
             animation = params[0]
             emotion = params[1] if (len(params) > 1) else None
-            transformed = Transformation(animation, emotion).get_behavior()
+            transformed = self.transformations.get_behavior(animation, emotion)
             self.process_action_play_motion(transformed, False)
         elif channel == 'action_led_color':
             self.process_action_led_color(data)
@@ -203,7 +228,7 @@ class RobotConsumer(CBSRdevice):
         Play a motion of a given robot by moving a given set of joints to a given angle for a given time frame.
 
         :param compressed: flag to indicate whether the motion data is compressed or not
-        :param message: zlib compressed json with the following format:
+        :param message: compressed motion, either in the binary format (see motion_codec) or as json:
         {'robot': '<nao/pepper>', 'compress_factor_angles': int, 'compress_factor_times': int,
         'motion': {'Joint1': {'angles': list, 'times': list}, 'JointN: {...}}}
         :return:
@@ -257,11 +282,15 @@ class RobotConsumer(CBSRdevice):
     def process_action_record_motion(self, message):
         """
         Two available commands:
-        To start motion recording: 'start;joint_chains;framerate'
+        To start motion recording: 'start;joint_chains;framerate', optionally followed by ';format;stream_interval'
         To stop motion recording: 'stop'
 
         joint_chains: list of joints or joins chains.
         framerate: number of recordings per second
+        format: 'binary' to publish the recording in the (compact) binary format, 'json' (default) otherwise
+        stream_interval: when > 0, the recording is published in parts (every stream_interval seconds) on
+        robot_motion_recording_part instead of as a whole on robot_motion_recording. The times in each part are
+        relative to the start of the recording, so the parts can simply be concatenated.
 
         Suitable joints and joint chains for nao:
         http://doc.aldebaran.com/2-8/family/nao_technical/bodyparts_naov6.html#nao-chains
@@ -274,21 +303,27 @@ class RobotConsumer(CBSRdevice):
         """
         try:
             if 'start' in message:
-                _, joint_chains, framerate = message.split(';')
+                params = message.split(';')
+                if len(params) < 3 or len(params) > 5:
+                    raise ValueError('Command for action_record_motion not recognized: ' + message)
+                joint_chains = params[1]
+                framerate = float(params[2])
+                motion_format = params[3] if len(params) > 3 else 'json'
+                stream_interval = float(params[4]) if len(params) > 4 else 0
                 joint_chains = loads(joint_chains)  # parse string json list to python list.
                 if not (isinstance(joint_chains, list)):
                     raise ValueError('The supplied joints and chains should be formatted as a list e.g. ["Head", ...].')
+                self.is_binary_motion_recording = (motion_format == 'binary')
                 self.is_motion_recording = True
-                self.record_motion_thread = Thread(target=self.record_motion, args=(joint_chains, float(framerate),))
+                self.record_motion_thread = Thread(target=self.record_motion,
+                                                   args=(joint_chains, framerate, stream_interval,))
                 self.record_motion_thread.start()
                 self.produce('RecordMotionStarted')
             elif message == 'stop':
                 self.is_motion_recording = False
                 self.record_motion_thread.join()
-                self.publish('robot_motion_recording',
-                             self.compress_motion(self.recorded_motion,
-                                                  PRECISION_FACTOR_MOTION_ANGLES,
-                                                  PRECISION_FACTOR_MOTION_TIMES))
+                if self.recorded_motion:  # i.e. not streamed in parts
+                    self.publish('robot_motion_recording', self.compress_recorded_motion(self.recorded_motion))
                 self.produce('RecordMotionDone')
                 self.recorded_motion = {}
             else:
@@ -319,19 +354,17 @@ class RobotConsumer(CBSRdevice):
             if len(leds) != len(colors):
                 raise ValueError('Number of leds not equal to the number of colors (' + str(len(leds)) + ' vs. '
                                  + str(len(colors)) + ')')
-            # loop over all leds and change to provided color.
+            # change all leds to their provided color at once (asynchronous calls instead of a thread per led).
             self.produce('LedColorStarted')
-            led_threads = []
+            led_calls = []
             for i in range(0, len(leds)):
                 if colors[i] == 'off':
-                    t = Thread(target=self.leds.off, args=(leds[i], ))
+                    led_calls.append(self.leds.off(leds[i], _async=True))
                 else:
-                    t = Thread(target=self.leds.fadeRGB, args=(leds[i], colors[i], fade_time, ))
-                t.start()
-                led_threads.append(t)
+                    led_calls.append(self.leds.fadeRGB(leds[i], colors[i], fade_time, _async=True))
 
-            for t in led_threads:
-                t.join()
+            for led_call in led_calls:
+                led_call.value()
             self.produce('LedColorDone')
         except ValueError as valerr:
             print(valerr.message)
@@ -357,25 +390,30 @@ class RobotConsumer(CBSRdevice):
                 if anim_type == 'rotate':
                     if not(location == 'eyes' or location == 'all'):
                         raise ValueError('Rotate animation is only possible when eyes are included.')
-                    self.led_animation_thread = Thread(target=self.led_animation_rotate,
-                                                       args=(location, colors, speed, ))
+                    frames = rotate_frames(location, colors)
+                    interval = speed / 4.0
                 elif anim_type == 'blink':
-                    self.led_animation_thread = Thread(target=self.led_animation_blink,
-                                                       args=(location, colors, speed,))
+                    frames = blink_frames(location, colors)
+                    interval = speed / 2.0
                 elif anim_type == 'alternate':
                     if location == 'chest':
                         raise ValueError('The chest can only show a blinking animation.')
-                    self.led_animation_thread = Thread(target=self.led_animation_alternate,
-                                                       args=(location, colors, speed, ))
+                    frames = alternate_frames(location, colors)
+                    interval = speed / 2.0
                 else:
                     raise ValueError('Led animation "' + anim_type + '" not recognized.')
+                self.stop_led_animation()
+                # the complete cycle of each led group is computed once, and then sent as a single call per cycle
+                timelines = dict((group, compile_timeline(group_frames, interval))
+                                 for group, group_frames in frames.items())
+                cycle_duration = interval * len(next(iter(frames.values())))
+                self.led_animation_thread = Thread(target=self.play_led_animation,
+                                                   args=(timelines, cycle_duration, interval,))
                 self.is_running_led_animation = True
                 self.led_animation_thread.start()
                 self.produce('LedAnimationStarted')
             elif message == 'stop':
-                if self.is_running_led_animation:
-                    self.is_running_led_animation = False
-                    self.led_animation_thread.join()
+                self.stop_led_animation()
                 for led in ['FaceLeds', 'ChestLeds', 'FeetLeds']:
                     self.leds.fadeRGB(led, Colors.to_rgb_hex('white'), 0)
                 self.produce('LedAnimationDone')
@@ -384,109 +422,45 @@ class RobotConsumer(CBSRdevice):
         except ValueError as e:
             print(e.message)
 
-    def led_animation_rotate(self, location, colors, speed):
-        """
-        Play rotate animation with given color and speed. Only the eyes can play the rotate animation.
-        In case location is 'all', the eyes will
-        rotate and the chest and feet will blink with the se
-        :param location: 'eyes' (default) or 'all'
-        :param colors: list of rgb hex color (when list size > 1, the first color will be used)
-        :param speed: rotations per second
-        :return:
-        """
-        interval = speed / 4.0
-        color = colors[0]
-        self.leds.off('FaceLeds')
-        while self.is_running_led_animation:
-            self.leds.off('FaceLedsExternal')
-            self.leds.fadeRGB('FaceLedsTop', color, 0)
-            if location == 'all':
-                self.leds.fadeRGB('ChestLeds', color, 0)
-                self.leds.fadeRGB('FeetLeds', color, 0)
-            sleep(interval)
-            self.leds.off('FaceLedsTop')
-            self.leds.fadeRGB('FaceLedsInternal', color, 0)
-            sleep(interval)
-            self.leds.off('FaceLedsInternal')
-            self.leds.fadeRGB('FaceLedsBottom', color, 0)
-            if location == 'all':
-                self.leds.off('ChestLeds')
-                self.leds.off('FeetLeds')
-            sleep(interval)
-            self.leds.off('FaceLedsBottom')
-            self.leds.fadeRGB('FaceLedsExternal', color, 0)
-            sleep(interval)
-
-    def led_animation_blink(self, location, colors, speed):
-        """
-        Let the given leds blink with given color and speed.
-
-        :param location: 'eyes', 'chest', 'feet', 'all' (default)
-        :param colors: list of rgb hex colors
-        :param speed: blinks per second
-        :return:
-        """
-        if location == 'eyes':
-            locs = ['FaceLeds']
-        elif location == 'chest':
-            locs = ['ChestLeds']
-        elif location == 'feet':
-            locs = ['FeetLeds']
-        else:  # location == 'all'
-            locs = ['FaceLeds', 'ChestLeds', 'FeetLeds']
-
-        interval = speed / 2.0
-        while self.is_running_led_animation:
-            for color in colors:
-                for loc in locs:
-                    self.leds.fadeRGB(loc, color, 0)
-                sleep(interval)
-                for loc in locs:
-                    self.leds.off(loc)
-                sleep(interval)
-
-    def led_animation_alternate(self, location, colors, speed):
+    def play_led_animation(self, timelines, cycle_duration, interval):
         """
-        Alternates two colors between left and right of pairs of leds (eyes and/or feet)
+        Plays the precomputed timelines (see led_animation.compile_timeline) until the animation is stopped.
+        Each cycle takes a single (asynchronous) ALLeds call per led group. The cycles are scheduled against a deadline,
+        so that the time these calls take does not accumulate, and a stop is noticed within a single frame.
 
-        :param location: 'eyes', 'feet', 'all' (default)
-        :param colors: list of rgb hex colors
-        :param speed: alternations per second
+        :param timelines: {led group: (list of rgb colors, list of times)}
+        :param cycle_duration: duration of a single cycle of the animation in seconds
+        :param interval: duration of a single frame of the animation in seconds
         :return:
         """
-        if location == 'eyes':
-            locs_left = ['LeftFaceLeds']
-            locs_right = ['RightFaceLeds']
-        elif location == 'feet':
-            locs_left = ['LeftFootLeds']
-            locs_right = ['RightFootLeds']
-        else:  # location == 'all'
-            locs_left = ['LeftFaceLeds', 'LeftFootLeds']
-            locs_right = ['RightFaceLeds', 'RightFootLeds']
-
-        if len(colors) > 1:
-            color_left = colors[0]
-            color_right = colors[1]
-        else:
-            color_left = colors[0]
-            color_right = colors[0]
-
-        interval = speed / 2
+        led_calls = []
+        deadline = self.monotonic_time()
         while self.is_running_led_animation:
-            for loc_left in locs_left:
-                self.leds.fadeRGB(loc_left, color_left, 0)
-            for loc_right in locs_right:
-                self.leds.off(loc_right)
-            if location == 'all':
-                self.leds.fadeRGB('ChestLeds', color_left, 0)
-            sleep(interval)
-            for loc_left in locs_left:
-                self.leds.off(loc_left)
-            for loc_right in locs_right:
-                self.leds.fadeRGB(loc_right, color_right, 0)
-            if location == 'all':
-                self.leds.fadeRGB('ChestLeds', color_right, 0)
-            sleep(interval)
+            led_calls = [self.leds.fadeListRGB(group, rgbs, times, _async=True)
+                         for group, (rgbs, times) in timelines.items()]
+            deadline += cycle_duration
+            remaining = deadline - self.monotonic_time()
+            if remaining < 0:  # fell behind; start the next cycle right away
+                deadline -= remaining
+            while self.is_running_led_animation and remaining > 0:
+                sleep(min(remaining, interval))
+                remaining = deadline - self.monotonic_time()
+        # (the remainder of) the current cycle should not overwrite any following command (e.g. the reset on a stop);
+        # ALLeds does not reliably support cancelling its calls, so any call that is not cancelled is waited for
+        # (for at most a single frame, so that the stop still takes effect within a frame)
+        for led_call in led_calls:
+            try:
+                led_call.cancel()
+            except RuntimeError:
+                pass
+        deadline = self.monotonic_time() + interval
+        for led_call in led_calls:
+            led_call.wait(max(int((deadline - self.monotonic_time()) * 1000), 0))
+
+    def stop_led_animation(self):
+        if self.is_running_led_animation:
+            self.is_running_led_animation = False
+            self.led_animation_thread.join()
 
     @staticmethod
     def to_hex_list(colors):
@@ -511,37 +485,58 @@ class RobotConsumer(CBSRdevice):
                     print(color + ' not available, will default to white')
         return hex_colors
 
-    def record_motion(self, joint_chains, framerate):
+    def record_motion(self, joint_chains, framerate, stream_interval=0):
         """
         Helper method for process_action_record_motion() that records the angles with for a number (framerate) of times
-        per second.
+        per second. Each sample is scheduled on a fixed deadline (so that the time getAngles takes does not make the
+        rate drift) and timestamped with the (monotonic) qi clock.
 
         :param joint_chains: list of joints and/or joint chains to record
         :param framerate: numer of recording per second
+        :param stream_interval: if > 0, publish (and then drop) the samples recorded so far every this many seconds
         :return:
         """
         # get list of joints from chains
         target_joints = self.generate_joint_list(joint_chains)
-
-        # Initialize motion
-        motion = {'robot': self.robot_type, 'motion': {}}
-        for joint in target_joints:
-            motion['motion'][joint] = {}
-            motion['motion'][joint]['angles'] = []
-            motion['motion'][joint]['times'] = []
+        buffer = MotionBuffer(target_joints)
 
         # record motion with a set framerate
-        time = 0.0
-        sleep_time = 1.0 / framerate
+        interval = 1.0 / framerate
+        start = self.monotonic_time()
+        deadline = start
+        last_part = start
         while self.is_motion_recording:
-            angles = self.motion.getAngles(target_joints, False)
-            for idx, joint in enumerate(target_joints):
-                motion['motion'][joint]['angles'].append(angles[idx])
-                motion['motion'][joint]['times'].append(time)
-            sleep(sleep_time)
-            time += sleep_time
+            sample_time = self.monotonic_time()
+            buffer.append(sample_time - start, self.motion.getAngles(target_joints, False))
+            if stream_interval > 0 and (sample_time - last_part) >= stream_interval:
+                self.publish('robot_motion_recording_part',
+                             self.compress_recorded_motion(buffer.to_motion(self.robot_type)))
+                buffer.clear()
+                last_part = sample_time
+
+            deadline += interval
+            delay = deadline - self.monotonic_time()
+            if delay > 0:
+                sleep(delay)
+            else:  # the deadline was missed: skip the missed sample(s) instead of trying to catch up
+                deadline = self.monotonic_time()
+
+        if stream_interval > 0:
+            if len(buffer):
+                self.publish('robot_motion_recording_part',
+                             self.compress_recorded_motion(buffer.to_motion(self.robot_type)))
+            self.recorded_motion = {}
+        else:
+            self.recorded_motion = buffer.to_motion(self.robot_type)
 
-        self.recorded_motion = motion
+    def compress_recorded_motion(self, motion):
+        return self.compress_motion(motion, PRECISION_FACTOR_MOTION_ANGLES, PRECISION_FACTOR_MOTION_TIMES,
+                                    self.is_binary_motion_recording)
+
+    @staticmethod
+    def monotonic_time():
+        """:return: the (steady) qi clock in seconds"""
+        return clockNow() / 1e9
 
     def generate_joint_list(self, joint_chains):
         """
@@ -602,110 +597,22 @@ class RobotConsumer(CBSRdevice):
         return all_joints
 
     @staticmethod
-    def compress_motion(motion, precision_factor_angles, precision_factor_times):
-        motion['precision_factor_angles'] = precision_factor_angles
-        motion['precision_factor_times'] = precision_factor_times
-        for joint in motion['motion'].keys():
-            motion['motion'][joint]['angles'] = [int(round(a * precision_factor_angles)) for a in
-                                                 motion['motion'][joint]['angles']]
-            motion['motion'][joint]['times'] = [int(round(t * precision_factor_times)) for t in
-                                                motion['motion'][joint]['times']]
-        motion = dumps(motion, separators=(',', ':'))
-        return motion
+    def compress_motion(motion, precision_factor_angles, precision_factor_times, binary=False):
+        if binary:
+            return encode_binary(motion, precision_factor_angles, precision_factor_times)
+        return encode_json(motion, precision_factor_angles, precision_factor_times)
 
     @staticmethod
     def decompress_motion(motion):
-        motion = loads(motion)
-        precision_factor_angles = float(motion['precision_factor_angles'])
-        precision_factor_times = float(motion['precision_factor_times'])
-        for joint in motion['motion'].keys():
-            motion['motion'][joint]['angles'] = [float(a / precision_factor_angles) for a in
-                                                 motion['motion'][joint]['angles']]
-            motion['motion'][joint]['times'] = [float(t / precision_factor_times) for t in
-                                                motion['motion'][joint]['times']]
-        return motion
+        return decode(motion)  # accepts both the binary and the json format
 
     def change_led_colour(self, type, value):
-        yellow = Colors.to_rgb_hex('yellow')
-        magenta = Colors.to_rgb_hex('magenta')
-        orange = Colors.to_rgb_hex('orange')
-        green = Colors.to_rgb_hex('green')
-
         self.leds.off(type)
-        if value == 'rainbow':  # make the eye colours rotate in the colors of the rainbow
-            if type == 'FaceLeds':
-                p1 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Bottom', [yellow, magenta, orange, green], [0, 0.5, 1, 1.5],))
-                p2 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Top', [magenta, orange, green, yellow], [0, 0.5, 1, 1.5],))
-                p3 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'External', [orange, green, yellow, magenta], [0, 0.5, 1, 1.5],))
-                p4 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Internal', [green, yellow, magenta, orange], [0, 0.5, 1, 1.5],))
-            elif type == 'EarLeds':
-                p1 = Thread(target=self.leds.fadeListRGB,
-                            args=('Right' + type + 'Even', [yellow, magenta, orange, green], [0, 0.5, 1, 1.5],))
-                p2 = Thread(target=self.leds.fadeListRGB,
-                            args=('Right' + type + 'Odd', [magenta, orange, green, yellow], [0, 0.5, 1, 1.5],))
-                p3 = Thread(target=self.leds.fadeListRGB,
-                            args=('Left' + type + 'Even', [orange, green, yellow, magenta], [0, 0.5, 1, 1.5],))
-                p4 = Thread(target=self.leds.fadeListRGB,
-                            args=('Left' + type + 'Odd', [green, yellow, magenta, orange], [0, 0.5, 1, 1.5],))
-            elif type == 'BrainLeds':
-                p1 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Back', [yellow, magenta, orange, green], [0, 0.5, 1, 1.5],))
-                p2 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Middle', [magenta, orange, green, yellow], [0, 0.5, 1, 1.5],))
-                p3 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Front', [orange, green, yellow, magenta], [0, 0.5, 1, 1.5],))
-                p4 = Thread(target=None)
-
-            p1.start()
-            p2.start()
-            p3.start()
-            p4.start()
-
-            p1.join()
-            p2.join()
-            p3.join()
-            p4.join()
-        elif value == 'greenyellow':  # make the eye colours a combination of green and yellow
-            if type == 'FaceLeds':
-                p1 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Bottom', [yellow, green, yellow, green], [0, 0.5, 1, 1.5],))
-                p2 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Top', [green, yellow, green, yellow], [0, 0.5, 1, 1.5],))
-                p3 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'External', [yellow, green, yellow, green], [0, 0.5, 1, 1.5],))
-                p4 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Internal', [green, yellow, green, yellow], [0, 0.5, 1, 1.5],))
-            elif type == 'EarLeds':
-                p1 = Thread(target=self.leds.fadeListRGB,
-                            args=('Right' + type + 'Even', [yellow, green, yellow, green], [0, 0.5, 1, 1.5],))
-                p2 = Thread(target=self.leds.fadeListRGB,
-                            args=('Right' + type + 'Odd', [green, yellow, green, yellow], [0, 0.5, 1, 1.5],))
-                p3 = Thread(target=self.leds.fadeListRGB,
-                            args=('Left' + type + 'Even', [yellow, green, yellow, green], [0, 0.5, 1, 1.5],))
-                p4 = Thread(target=self.leds.fadeListRGB,
-                            args=('Left' + type + 'Odd', [green, yellow, green, yellow], [0, 0.5, 1, 1.5],))
-            elif type == 'BrainLeds':
-                p1 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Back', [yellow, green, yellow, green], [0, 0.5, 1, 1.5],))
-                p2 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Middle', [green, yellow, green, yellow], [0, 0.5, 1, 1.5],))
-                p3 = Thread(target=self.leds.fadeListRGB,
-                            args=(type + 'Front', [yellow, green, yellow, green], [0, 0.5, 1, 1.5],))
-                p4 = Thread(target=None)
-
-            p1.start()
-            p2.start()
-            p3.start()
-            p4.start()
-
-            p1.join()
-            p2.join()
-            p3.join()
-            p4.join()
+        if value in PATTERNS:  # 'rainbow' (rotate the colours of the rainbow) or 'greenyellow' (alternate them)
+            led_calls = [self.leds.fadeListRGB(subgroup, rgbs, PATTERN_TIMES, _async=True)
+                         for subgroup, rgbs in pattern_colours(type, value)]
+            for led_call in led_calls:
+                led_call.value()
         elif value:
             self.leds.fadeRGB(type, value, 0.1)
 
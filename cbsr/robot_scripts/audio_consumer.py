@@ -1,12 +1,21 @@
 import os
 from argparse import ArgumentParser
 from tempfile import NamedTemporaryFile
-from threading import Thread, Timer
+from threading import Timer
 from time import sleep
 
 from cbsr.device import CBSRdevice
+from cbsr.dispatcher import ResourceDispatcher
 from qi import Application
 
+# The robot resource each command uses; commands on the same resource are executed in the order they were received,
+# commands on different resources can be executed in parallel (by at most DISPATCH_WORKERS threads).
+# Stopping speech uses its own resource, so that it is not queued behind the speech it should interrupt.
+RESOURCES = {'action_say': 'speech', 'action_say_animated': 'speech', 'audio_language': 'speech',
+             'action_speech_param': 'speech', 'action_stop_talking': 'speech_control',
+             'action_play_audio': 'audio', 'action_load_audio': 'audio_files', 'action_clear_audio': 'audio_files'}
+DISPATCH_WORKERS = 3
+
 
 class RobotAudio(CBSRdevice):
     def __init__(self, session, server, username, password, topics, profiling):
@@ -19,6 +28,7 @@ class RobotAudio(CBSRdevice):
         self.loaded_audio = {}
         self.backup_timer = None
 
+        self.dispatcher = ResourceDispatcher(DISPATCH_WORKERS, self.profiling_wait)
         self.topics = topics
         super(RobotAudio, self).__init__(server, username, password, profiling)
 
@@ -28,9 +38,16 @@ class RobotAudio(CBSRdevice):
     def get_channel_action_mapping(self):
         return dict.fromkeys((self.get_full_channel(t) for t in self.topics), self.execute)
 
+    def cleanup(self):
+        self.dispatcher.stop()
+        print(self.dispatcher.report())
+
     def execute(self, message):
-        t = Thread(target=self.process_message, args=(message,))
-        t.start()
+        channel = self.get_channel_name(message['channel'])
+        if channel == 'action_play_audio':
+            # a new clip interrupts the one that is playing (which would otherwise block the audio resource until done)
+            self.audio_player.stopAll()
+        self.dispatcher.submit(RESOURCES.get(channel, channel), self.process_message, message)
 
     def process_message(self, message):
         channel = self.get_channel_name(message['channel'])
@@ -6,6 +6,8 @@ from uuid import getnode
 
 from redis import Redis
 
+from cbsr.subscriber import CBSRsubscriber
+
 
 class CBSRdevice(object):
     def __init__(self, server, username, password, profiling):
@@ -32,11 +34,10 @@ class CBSRdevice(object):
             self.profiling_end('PING', ping_start)
         mapping = self.get_channel_action_mapping()
         if mapping:
-            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
-            pubsub.subscribe(**mapping)
-            self.pubsub_thread = pubsub.run_in_thread(sleep_time=0.001)
+            self.subscriber = CBSRsubscriber(self.redis, mapping,
+                                             self.profiling_dispatch if self.profiler_queue else None)
         else:
-            self.pubsub_thread = None
+            self.subscriber = None
         device_type = self.get_device_type()
         if device_type:
             identifier_thread = Thread(target=self.announce, args=(device_type,))
@@ -84,6 +85,13 @@ class CBSRdevice(object):
             diff = (default_timer() - start) * 1000
             self.profiler_queue.put_nowait(label + ';' + ('%.1f' % diff))
 
+    def profiling_wait(self, resource, wait, depth):
+        if self.profiler_queue:
+            self.profiler_queue.put_nowait('WAIT_' + resource.upper() + ';' + ('%.1f' % (wait * 1000)) + ';' + str(depth))
+
+    def profiling_dispatch(self, duration):
+        self.profiler_queue.put_nowait('DISPATCH;' + ('%.1f' % (duration * 1000)))
+
     def profile(self):
         while self.profiler_queue and self.running:
             item = self.profiler_queue.get()
@@ -96,8 +104,12 @@ class CBSRdevice(object):
             self.profiler_queue.put_nowait('END;')
         print('Trying to exit gracefully...')
         try:
-            if self.pubsub_thread:
-                self.pubsub_thread.stop()
+            if self.subscriber:
+                print('Dispatch latency: ' + str(self.subscriber.latency))
+                self.subscriber.stop()
+            device_type = self.get_device_type()
+            if device_type:  # lets the services of this device shut down right away
+                self.redis.zrem('user:' + self.username, self.device + ':' + device_type)
             self.redis.close()
             print('Graceful exit was successful')
         except Exception as exc:
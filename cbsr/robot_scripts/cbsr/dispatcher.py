@@ -0,0 +1,79 @@
+from collections import deque
+from threading import Condition, Thread
+from timeit import default_timer
+
+from cbsr.subscriber import DispatchLatency
+
+
+class ResourceDispatcher(object):
+    """Runs commands on a fixed number of worker threads, with a FIFO queue per resource (e.g. 'motion' or 'leds'):
+    commands for the same resource are run in order, whilst commands for different resources are run in parallel.
+    For each resource, the maximum queue depth and the time commands wait in the queue are kept track of."""
+
+    def __init__(self, workers=4, on_wait=None):
+        self.on_wait = on_wait
+        self.running = True
+        self.condition = Condition()
+        self.pending = {}  # resource -> deque of (function, args, time of submission)
+        self.ready = deque()  # resources with a pending command that no worker is running for
+        self.scheduled = set()  # resources that are either ready or being run by a worker
+        self.max_depth = {}
+        self.waits = {}
+
+        self.workers = []
+        for _ in range(workers):
+            worker = Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, resource, function, *args):
+        with self.condition:
+            queue = self.pending.get(resource)
+            if queue is None:
+                queue = self.pending[resource] = deque()
+                self.max_depth[resource] = 0
+                self.waits[resource] = DispatchLatency()
+            queue.append((function, args, default_timer()))
+            self.max_depth[resource] = max(self.max_depth[resource], len(queue))
+            if resource not in self.scheduled:
+                self.scheduled.add(resource)
+                self.ready.append(resource)
+                self.condition.notify()
+
+    def work(self):
+        while True:
+            with self.condition:
+                while self.running and not self.ready:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                resource = self.ready.popleft()
+                function, args, submitted = self.pending[resource].popleft()
+                depth = len(self.pending[resource])
+
+            wait = default_timer() - submitted
+            self.waits[resource].add(wait)
+            if self.on_wait:
+                self.on_wait(resource, wait, depth)
+            try:
+                function(*args)
+            except Exception as err:
+                print('Command for ' + resource + ' failed: ' + str(err))
+            finally:
+                with self.condition:
+                    if self.pending[resource]:
+                        self.ready.append(resource)
+                        self.condition.notify()
+                    else:
+                        self.scheduled.discard(resource)
+
+    def report(self):
+        with self.condition:
+            return '\n'.join(resource + ': max_depth=' + str(self.max_depth[resource]) + ' wait ' +
+                             str(self.waits[resource]) for resource in sorted(self.pending.keys()))
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
@@ -0,0 +1,114 @@
+from colors import Colors
+
+OFF = 0x000000
+FADE_STEP = 0.01  # seconds in which a color change within a timeline is made (i.e. (almost) instantly)
+
+# The sub-groups that make up an LED group for the multi-colour patterns of change_led_colour
+PATTERNS = ['rainbow', 'greenyellow']
+PATTERN_TIMES = [0, 0.5, 1, 1.5]
+LED_SUBGROUPS = {'FaceLeds': ['FaceLedsBottom', 'FaceLedsTop', 'FaceLedsExternal', 'FaceLedsInternal'],
+                 'EarLeds': ['RightEarLedsEven', 'RightEarLedsOdd', 'LeftEarLedsEven', 'LeftEarLedsOdd'],
+                 'BrainLeds': ['BrainLedsBack', 'BrainLedsMiddle', 'BrainLedsFront']}
+
+
+def to_rgb(color):
+    """:return: the given color ('off', an rgb hex string, or an int) as an int for ALLeds.fadeListRGB"""
+    if color == 'off':
+        return OFF
+    if isinstance(color, int):
+        return color
+    return int(str(color).rstrip('L'), 16)  # hex() adds an L to longs in python 2
+
+
+def pattern_colours(group, pattern):
+    """
+    The colours each sub-group of the given LED group fades through for the multi-colour patterns,
+    i.e. 'rainbow' (the colours rotate over the sub-groups) or 'greenyellow' (the sub-groups alternate).
+
+    :return: list of (sub-group, list of rgb ints) tuples (empty if the group has no sub-groups)
+    """
+    yellow = Colors.to_rgb_hex('yellow')
+    green = Colors.to_rgb_hex('green')
+    if pattern == 'rainbow':
+        rainbow = [yellow, Colors.to_rgb_hex('magenta'), Colors.to_rgb_hex('orange'), green]
+        return [(subgroup, rainbow[i:] + rainbow[:i]) for i, subgroup in enumerate(LED_SUBGROUPS.get(group, []))]
+    return [(subgroup, [yellow, green, yellow, green] if i % 2 == 0 else [green, yellow, green, yellow])
+            for i, subgroup in enumerate(LED_SUBGROUPS.get(group, []))]
+
+
+def compile_timeline(frames, interval):
+    """
+    Converts the colour of an LED group for each frame of an animation into the arguments of a single
+    ALLeds.fadeListRGB call, in which each colour change happens (almost) instantly at the start of its frame.
+
+    :param frames: list of rgb ints, one per frame
+    :param interval: duration of a frame in seconds
+    :return: (list of rgb ints, list of times in seconds)
+    """
+    step = min(FADE_STEP, interval / 10.0)
+    rgbs = [frames[0]]
+    times = [step]
+    for i in range(1, len(frames)):
+        if frames[i] != frames[i - 1]:
+            # hold the previous colour until the start of this frame, then switch
+            rgbs.extend([frames[i - 1], frames[i]])
+            times.extend([i * interval, i * interval + step])
+    return rgbs, times
+
+
+def rotate_frames(location, colors):
+    """The eye segments light up one after another; with location 'all' the chest and feet blink along.
+    :return: {led group: list of rgb ints (one per frame)}"""
+    color = to_rgb(colors[0])
+    frames = {'FaceLedsTop': [color, OFF, OFF, OFF],
+              'FaceLedsInternal': [OFF, color, OFF, OFF],
+              'FaceLedsBottom': [OFF, OFF, color, OFF],
+              'FaceLedsExternal': [OFF, OFF, OFF, color]}
+    if location == 'all':
+        frames['ChestLeds'] = [color, color, OFF, OFF]
+        frames['FeetLeds'] = [color, color, OFF, OFF]
+    return frames
+
+
+def blink_frames(location, colors):
+    """Each of the colors is shown for one frame, followed by a frame with the leds off.
+    :return: {led group: list of rgb ints (one per frame)}"""
+    if location == 'eyes':
+        locs = ['FaceLeds']
+    elif location == 'chest':
+        locs = ['ChestLeds']
+    elif location == 'feet':
+        locs = ['FeetLeds']
+    else:  # location == 'all'
+        locs = ['FaceLeds', 'ChestLeds', 'FeetLeds']
+
+    sequence = []
+    for color in colors:
+        sequence.extend([to_rgb(color), OFF])
+    return dict((loc, list(sequence)) for loc in locs)
+
+
+def alternate_frames(location, colors):
+    """Alternates between the left leds (in the first color) and the right leds (in the second color).
+    :return: {led group: list of rgb ints (one per frame)}"""
+    if location == 'eyes':
+        locs_left = ['LeftFaceLeds']
+        locs_right = ['RightFaceLeds']
+    elif location == 'feet':
+        locs_left = ['LeftFootLeds']
+        locs_right = ['RightFootLeds']
+    else:  # location == 'all'
+        locs_left = ['LeftFaceLeds', 'LeftFootLeds']
+        locs_right = ['RightFaceLeds', 'RightFootLeds']
+
+    color_left = to_rgb(colors[0])
+    color_right = to_rgb(colors[1]) if len(colors) > 1 else color_left
+
+    frames = {}
+    for loc_left in locs_left:
+        frames[loc_left] = [color_left, OFF]
+    for loc_right in locs_right:
+        frames[loc_right] = [OFF, color_right]
+    if location == 'all':
+        frames['ChestLeds'] = [color_left, color_right]
+    return frames
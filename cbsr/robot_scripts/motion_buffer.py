@@ -0,0 +1,40 @@
+import numpy as np
+
+CHUNK_SIZE = 512  # number of samples the buffer grows by at a time
+
+
+class MotionBuffer(object):
+    """Recorded angles of a fixed list of joints, kept in a preallocated array that grows in chunks
+    (instead of a list of Python floats per joint)."""
+
+    def __init__(self, joints, chunk_size=CHUNK_SIZE):
+        self.joints = joints
+        self.chunk_size = chunk_size
+        self.times = np.empty(chunk_size)
+        self.angles = np.empty((chunk_size, len(joints)))
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, time, angles):
+        if self.size == len(self.times):
+            self.times = np.concatenate((self.times, np.empty(self.chunk_size)))
+            self.angles = np.concatenate((self.angles, np.empty((self.chunk_size, len(self.joints)))))
+        self.times[self.size] = time
+        self.angles[self.size] = angles
+        self.size += 1
+
+    def clear(self):
+        """Empties the buffer, shrinking it back to a single chunk"""
+        self.times = np.empty(self.chunk_size)
+        self.angles = np.empty((self.chunk_size, len(self.joints)))
+        self.size = 0
+
+    def to_motion(self, robot):
+        """:return: the recorded samples in the motion format ({'robot': ..., 'motion': {joint: {'angles', 'times'}}})"""
+        times = self.times[:self.size].tolist()
+        motion = {'robot': robot, 'motion': {}}
+        for idx, joint in enumerate(self.joints):
+            motion['motion'][joint] = {'angles': self.angles[:self.size, idx].tolist(), 'times': list(times)}
+        return motion
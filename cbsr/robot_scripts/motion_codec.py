@@ -0,0 +1,103 @@
+from struct import pack, unpack_from
+from zlib import compress, decompress
+
+import numpy as np
+from simplejson import dumps, loads
+
+# Binary motion format (all little-endian):
+#   MAGIC, flags (uint8; FLAG_ZLIB when the remainder is zlib compressed), and then:
+#   robot name length (uint8) + name, precision factor for angles and for times (uint16 each), joint count (uint16),
+#   and for each joint: name length (uint8) + name, sample count (uint32),
+#   followed by the angles and then the times, each as an item size (uint8; 2 or 4) + delta-encoded ints.
+# The deltas of sampled angles and times are small, so int16 almost always suffices (int32 is used otherwise).
+MAGIC = b'CBM1'
+FLAG_ZLIB = 1
+INT16_MIN, INT16_MAX = np.iinfo(np.int16).min, np.iinfo(np.int16).max
+
+
+def is_binary_motion(data):
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode_json(motion, precision_factor_angles, precision_factor_times):
+    """The original (JSON) format: angles and times scaled to ints and stored as lists"""
+    motion['precision_factor_angles'] = precision_factor_angles
+    motion['precision_factor_times'] = precision_factor_times
+    for joint in motion['motion'].keys():
+        motion['motion'][joint]['angles'] = [int(round(a * precision_factor_angles)) for a in
+                                             motion['motion'][joint]['angles']]
+        motion['motion'][joint]['times'] = [int(round(t * precision_factor_times)) for t in
+                                            motion['motion'][joint]['times']]
+    return dumps(motion, separators=(',', ':'))
+
+
+def decode_json(data):
+    motion = loads(data)
+    precision_factor_angles = float(motion['precision_factor_angles'])
+    precision_factor_times = float(motion['precision_factor_times'])
+    for joint in motion['motion'].keys():
+        motion['motion'][joint]['angles'] = [float(a / precision_factor_angles) for a in
+                                             motion['motion'][joint]['angles']]
+        motion['motion'][joint]['times'] = [float(t / precision_factor_times) for t in
+                                            motion['motion'][joint]['times']]
+    return motion
+
+
+def encode_binary(motion, precision_factor_angles, precision_factor_times, use_zlib=True):
+    robot = motion['robot'].encode('utf-8')
+    joints = motion['motion']
+    parts = [pack('<B', len(robot)), robot,
+             pack('<HHH', precision_factor_angles, precision_factor_times, len(joints))]
+    for joint, values in joints.items():
+        name = joint.encode('utf-8')
+        parts.append(pack('<B', len(name)) + name + pack('<I', len(values['angles'])))
+        parts.append(_encode_deltas(values['angles'], precision_factor_angles))
+        parts.append(_encode_deltas(values['times'], precision_factor_times))
+    body = b''.join(parts)
+    if use_zlib:
+        return MAGIC + pack('<B', FLAG_ZLIB) + compress(body)
+    return MAGIC + pack('<B', 0) + body
+
+
+def decode_binary(data):
+    flags = unpack_from('<B', data, len(MAGIC))[0]
+    body = data[len(MAGIC) + 1:]
+    if flags & FLAG_ZLIB:
+        body = decompress(body)
+
+    robot_length = unpack_from('<B', body, 0)[0]
+    robot = body[1:1 + robot_length].decode('utf-8')
+    offset = 1 + robot_length
+    precision_factor_angles, precision_factor_times, joint_count = unpack_from('<HHH', body, offset)
+    offset += 6
+    motion = {'robot': robot, 'precision_factor_angles': precision_factor_angles,
+              'precision_factor_times': precision_factor_times, 'motion': {}}
+    for _ in range(joint_count):
+        name_length = unpack_from('<B', body, offset)[0]
+        name = body[offset + 1:offset + 1 + name_length].decode('utf-8')
+        count = unpack_from('<I', body, offset + 1 + name_length)[0]
+        offset += 5 + name_length
+        angles, offset = _decode_deltas(body, offset, count, precision_factor_angles)
+        times, offset = _decode_deltas(body, offset, count, precision_factor_times)
+        motion['motion'][name] = {'angles': angles, 'times': times}
+    return motion
+
+
+def decode(data):
+    """Decodes a motion in either the binary or the (original) JSON format"""
+    return decode_binary(data) if is_binary_motion(data) else decode_json(data)
+
+
+def _encode_deltas(values, precision_factor):
+    scaled = np.rint(np.asarray(values, dtype=np.float64) * precision_factor).astype(np.int64)
+    deltas = np.diff(np.concatenate(([0], scaled)))
+    dtype = np.int16 if (deltas.size == 0 or (deltas.min() >= INT16_MIN and deltas.max() <= INT16_MAX)) else np.int32
+    return pack('<B', np.dtype(dtype).itemsize) + deltas.astype(np.dtype(dtype).newbyteorder('<')).tobytes()
+
+
+def _decode_deltas(body, offset, count, precision_factor):
+    itemsize = unpack_from('<B', body, offset)[0]
+    dtype = np.dtype(np.int16 if itemsize == 2 else np.int32).newbyteorder('<')
+    deltas = np.frombuffer(body, dtype=dtype, count=count, offset=offset + 1)
+    values = np.cumsum(deltas, dtype=np.int64) / float(precision_factor)
+    return values.tolist(), offset + 1 + count * itemsize
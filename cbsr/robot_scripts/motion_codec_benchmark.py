@@ -0,0 +1,67 @@
+"""Compares the binary motion format with the original json format (size, encode and decode times).
+
+Usage: python motion_codec_benchmark.py [recording.json ...]
+The recordings are as published on robot_motion_recording (json); without any, a synthetic whole-body recording is used.
+"""
+from argparse import ArgumentParser
+from copy import deepcopy
+from math import sin
+from random import Random
+from timeit import default_timer
+
+from motion_codec import decode_binary, decode_json, encode_binary, encode_json
+
+PRECISION_FACTOR_MOTION_ANGLES = 1000
+PRECISION_FACTOR_MOTION_TIMES = 100
+NAO_JOINTS = ['HeadYaw', 'HeadPitch', 'LShoulderPitch', 'LShoulderRoll', 'LElbowYaw', 'LElbowRoll', 'LWristYaw',
+              'LHand', 'LHipYawPitch', 'LHipRoll', 'LHipPitch', 'LKneePitch', 'LAnklePitch', 'LAnkleRoll',
+              'RHipYawPitch', 'RHipRoll', 'RHipPitch', 'RKneePitch', 'RAnklePitch', 'RAnkleRoll', 'RShoulderPitch',
+              'RShoulderRoll', 'RElbowYaw', 'RElbowRoll', 'RWristYaw', 'RHand']
+
+
+def synthetic_recording(seconds=120, framerate=50.0):
+    random = Random(42)
+    frames = int(seconds * framerate)
+    motion = {'robot': 'nao', 'motion': {}}
+    for joint in NAO_JOINTS:
+        phase = random.uniform(0, 6.28)
+        motion['motion'][joint] = {'angles': [sin(phase + i / 40.0) + random.gauss(0, 0.002) for i in range(frames)],
+                                   'times': [i / framerate for i in range(frames)]}
+    return motion
+
+
+def measure(function, argument, repeat):
+    best = None
+    for _ in range(repeat):
+        arg = deepcopy(argument)  # the json encoder modifies its input
+        start = default_timer()
+        result = function(arg)
+        duration = default_timer() - start
+        best = duration if best is None else min(best, duration)
+    return result, best * 1000
+
+
+def benchmark(name, motion, repeat):
+    json_data, json_encode = measure(lambda m: encode_json(m, PRECISION_FACTOR_MOTION_ANGLES,
+                                                           PRECISION_FACTOR_MOTION_TIMES), motion, repeat)
+    binary_data, binary_encode = measure(lambda m: encode_binary(m, PRECISION_FACTOR_MOTION_ANGLES,
+                                                                 PRECISION_FACTOR_MOTION_TIMES), motion, repeat)
+    _, json_decode = measure(decode_json, json_data, repeat)
+    _, binary_decode = measure(decode_binary, binary_data, repeat)
+    print('%s:\n  json:   %8d bytes, encode %7.1fms, decode %7.1fms\n  binary: %8d bytes, encode %7.1fms, '
+          'decode %7.1fms' % (name, len(json_data), json_encode, json_decode,
+                              len(binary_data), binary_encode, binary_decode))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('recordings', nargs='*', help='Recorded motions (json, as published by the robot)')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs (the best is reported)')
+    args = parser.parse_args()
+
+    if args.recordings:
+        for recording in args.recordings:
+            with open(recording, 'rb') as f:
+                benchmark(recording, decode_json(f.read()), args.repeat)
+    else:
+        benchmark('synthetic (26 joints, 120s at 50fps)', synthetic_recording(), args.repeat)
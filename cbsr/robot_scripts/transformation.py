@@ -1,8 +1,11 @@
+from collections import OrderedDict
 from colorsys import hsv_to_rgb
+from hashlib import md5
 from math import atan2, degrees
+from threading import Lock
 from xml.etree.ElementTree import XML
 
-from pandas import Series
+import numpy as np
 
 SPEEDS = {'slow': 1.0, 'normal': 0.5, 'fast': 0.35, 'adjusted_norm': 0.5, 'neutral_norm': 0.30}
 EMOTIONS = {
@@ -106,13 +109,35 @@ class Transformation(object):
         self.emotion = EMOTIONS[emotion] if (emotion in EMOTIONS) else None
 
     def get_behavior(self):
-        behavior, pivot_states = self.get_angle_time_representation()
+        """
+        The transformations work on tracks: joints x keyframes arrays of angles with a single row of times.
+        Usually all joints are in every state and thus form a single track; otherwise the joints are grouped by their
+        number of keyframes (as the times are numbered per joint). Only the result is converted to the NAOqi format.
+
+        :return: {'JointN': {'angles': list, 'times': list}, ..., 'LED': {'colors': list, 'times': list}}
+        """
+        tracks, pivot_states = self.get_angle_time_representation()
+        postures = {}
+        led = None
         if self.emotion:
-            behavior = self.modify_flow_parameters(behavior, pivot_states)
-            behavior = self.modify_time_parameters(behavior)
-            behavior = self.modify_weight_parameters(behavior)
-            behavior = self.modify_led_parameters(behavior)
+            modified = []
+            for joints, angles, times in tracks:
+                angles = self.modify_flow_parameters(angles, times, pivot_states)
+                angles, times = self.modify_time_parameters(angles, times)
+                modified.append((joints, angles, times))
+            tracks = modified
+            postures = self.modify_weight_parameters(tracks)
+            # the posture joints (see modify_weight_parameters) all end before the last keyframe
+            led = self.modify_led_parameters(max(times[-1] for _, _, times in tracks))
 
+        behavior = {}
+        for joints, angles, times in tracks:
+            times_list = times.tolist()
+            for idx, joint_name in enumerate(joints):
+                behavior[joint_name] = {'angles': angles[idx].tolist(), 'times': list(times_list)}
+        behavior.update(postures)
+        if led:
+            behavior['LED'] = led
         return behavior
 
     def get_angle_time_representation(self):
@@ -123,23 +148,19 @@ class Transformation(object):
         else:
             time_increment = SPEEDS['adjusted_norm']
 
-        representation = {}
+        sequences = OrderedDict()  # the angles of each joint, in the order of the states it is in
         pivot_states = []
-        i = 0
-        for state in self.root.iter('state'):
+        for i, state in enumerate(self.root.iter('state')):
             if state.get('name'):
                 pivot_states.append(i)
             for joint in state.findall('joint'):
-                angle = float(joint.text)
-                name = joint.get('name')
-                if name in representation:
-                    representation[name]['angles'].append(angle)
-                    representation[name]['times'].append(time_increment * len(representation[name]['times']))
-                else:
-                    representation.update({name: {'angles': [angle], 'times': [0]}})
-            i = i + 1
+                sequences.setdefault(joint.get('name'), []).append(float(joint.text))
 
-        return representation, pivot_states
+        tracks = OrderedDict()  # number of keyframes: joints
+        for name, angles in sequences.items():
+            tracks.setdefault(len(angles), []).append(name)
+        return [(joints, np.array([sequences[name] for name in joints], dtype=np.float64),
+                 time_increment * np.arange(count)) for count, joints in tracks.items()], pivot_states
 
     def get_repeats(self):
         repeats = 0
@@ -175,70 +196,58 @@ class Transformation(object):
             ret = up * self.emotion['valence']
         return ret
 
-    def modify_flow_parameters(self, behavior, pivot_states):
+    def modify_flow_parameters(self, angles, times, pivot_states):
         amplitude = self.get_affective_amplitude()
-        for joint_name in behavior.keys():
-            theta_init = behavior[joint_name]['angles'][pivot_states[0]]
-            theta_end = behavior[joint_name]['angles'][pivot_states[-1]]
-            for i in range(0, len(behavior[joint_name]['times'])):
-                normalized_time = (behavior[joint_name]['times'][i] - behavior[joint_name]['times'][0]) / (
-                        behavior[joint_name]['times'][-1] - behavior[joint_name]['times'][0])
-                line_angle = theta_init * (1 - normalized_time) + theta_end * normalized_time
-                behavior[joint_name]['angles'][i] = amplitude * behavior[joint_name]['angles'][i] + (
-                        1 - amplitude) * line_angle
-
-        return behavior
+        theta_init = angles[:, pivot_states[0], np.newaxis]
+        theta_end = angles[:, pivot_states[-1], np.newaxis]
+        normalized_time = (times - times[0]) / (times[-1] - times[0])
+        line_angles = theta_init * (1 - normalized_time) + theta_end * normalized_time
+        return amplitude * angles + (1 - amplitude) * line_angles
 
-    def modify_time_parameters(self, behavior):
+    def modify_time_parameters(self, angles, times):
         repetitions = self.get_affective_repetition()
         repeat = self.get_repeats()
-        for joint_name in behavior.keys():
-            time_increment = behavior[joint_name]['times'][1]
-            behavior[joint_name]['angles'] = behavior[joint_name]['angles'] * (repetitions + repeat + 1)
-            for i in range(0, len(behavior[joint_name]['times']) * (repetitions + repeat)):
-                behavior[joint_name]['times'].append(time_increment * len(behavior[joint_name]['times']))
+        angles = np.tile(angles, (1, repetitions + repeat + 1))
+        times = times[1] * np.arange(angles.shape[1])
 
         speed = self.get_affective_speed()
         # if speed > 1:
         #    speed = 1 + (speed - 1) * 2
         # else:
         #    speed = 1 - (1 - speed) * 2
-        for joint_name in behavior.keys():
-            times = Series(behavior[joint_name]['times'])
-            times = (times / speed).tolist()
-            behavior[joint_name]['times'] = times
-
-        return behavior
+        return angles, times / speed
 
-    def modify_weight_parameters(self, behavior):
+    def modify_weight_parameters(self, tracks):
+        """Tilts the head (in its track) and adds a posture for each of the (leg) joints not in the behavior.
+        :return: the (two keyframe) posture joints as {'JointN': {'angles': list, 'times': list}}"""
         pitch = self.get_affective_head_pitch()
-        start_time = behavior[behavior.keys()[0]]['times'][1]
-        if 'HeadPitch' not in behavior.keys():
-            behavior.update({'HeadPitch': {'angles': [pitch, pitch], 'times': [0, start_time]}})
+        start_time = float(tracks[0][2][1])
+        joints = [joint_name for track_joints, _, _ in tracks for joint_name in track_joints]
+        postures = {}
+        if 'HeadPitch' not in joints:
+            postures['HeadPitch'] = {'angles': [pitch, pitch], 'times': [0, start_time]}
         else:
-            behavior['HeadPitch']['angles'] = [(pitch + x) for x in behavior['HeadPitch']['angles']]
+            for track_joints, angles, _ in tracks:
+                if 'HeadPitch' in track_joints:
+                    angles[track_joints.index('HeadPitch')] += pitch
 
         if self.emotion['arousal'] < -0.5:
-            for joint_name in BEND:
-                if joint_name not in behavior:
-                    behavior.update(
-                        {joint_name: {'angles': [BEND[joint_name], BEND[joint_name]], 'times': [0, start_time]}})
+            posture = BEND
         elif self.emotion['arousal'] > 0.5:
-            for joint_name in UPRIGHT:
-                if joint_name not in behavior:
-                    behavior.update(
-                        {joint_name: {'angles': [UPRIGHT[joint_name], UPRIGHT[joint_name]], 'times': [0, start_time]}})
+            posture = UPRIGHT
         else:
-            for joint_name in NEUTRAL:
-                if joint_name not in behavior:
-                    behavior.update(
-                        {joint_name: {'angles': [NEUTRAL[joint_name], NEUTRAL[joint_name]], 'times': [0, start_time]}})
+            posture = NEUTRAL
+        for joint_name in posture:
+            if joint_name not in joints:
+                postures[joint_name] = {'angles': [posture[joint_name], posture[joint_name]], 'times': [0, start_time]}
 
-        return behavior
+        return postures
 
-    def modify_led_parameters(self, behavior):
+    def modify_led_parameters(self, duration):
+        """:return: the LED timeline (for a behavior of the given duration) as {'colors': list, 'times': list},
+        or None for a neutral emotion"""
         if (self.emotion['valence'] == 0) and (self.emotion['arousal'] == 0):
-            return behavior
+            return None
 
         hue = degrees(atan2(self.emotion['valence'], self.emotion['arousal']))
         if hue < 0:
@@ -252,23 +261,35 @@ class Transformation(object):
 
         period = (4 - 0.4) * (1 - self.emotion['arousal']) / 2.0 + 0.4
         rise_ratio = (0.5 - 0.1) * (1 - self.emotion['arousal']) / 2.0 + 0.1
-        rise_time = [rise_ratio, 0.5, (rise_ratio + 0.5), 1.0]
+        rise_time = np.array([rise_ratio, 0.5, (rise_ratio + 0.5), 1.0])
 
-        duration = 0
-        for i in behavior.itervalues():
-            if duration < max(i['times']):
-                duration = max(i['times'])
         rep = int(round(duration / period))
 
         if rep != 0:
             colors = colors * rep
 
-        rise_times = list(rise_time)
-        for i in range(1, rep):
-            tmp = [rise_times[-1] + x for x in rise_time]
-            rise_times.extend(tmp)
+        # each repetition of the 4 rise times is shifted by one period
+        rise_times = (rise_time + np.arange(max(rep, 1))[:, np.newaxis]).ravel() * period
+        return {'colors': colors, 'times': rise_times.tolist()}
+
+
+class TransformationCache(object):
+    """LRU cache of transformed behaviors, keyed by a hash of the animation XML and the emotion.
+    The returned behaviors are shared between calls, so they should not be modified."""
 
-        rise_times = [x * period for x in rise_times]
-        behavior.update({'LED': {'colors': colors, 'times': rise_times}})
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.behaviors = OrderedDict()
+        self.lock = Lock()
 
+    def get_behavior(self, xml, emotion=None):
+        data = xml if isinstance(xml, bytes) else xml.encode('utf-8')
+        key = (md5(data).hexdigest(), emotion)
+        with self.lock:
+            behavior = self.behaviors.pop(key, None)
+            if behavior is None:
+                behavior = Transformation(xml, emotion).get_behavior()
+            self.behaviors[key] = behavior  # (re)insert as the most recently used
+            if len(self.behaviors) > self.max_size:
+                self.behaviors.popitem(last=False)
         return behavior
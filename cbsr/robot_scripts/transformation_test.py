@@ -0,0 +1,178 @@
+"""Checks that the (numpy) Transformation gives the same behaviors as the original per-joint implementation,
+for every emotion in EMOTIONS.
+
+Usage: python -m unittest transformation_test
+"""
+from collections import OrderedDict
+from colorsys import hsv_to_rgb
+from math import atan2, degrees
+from unittest import TestCase, main
+
+from transformation import BEND, EMOTIONS, NEUTRAL, SPEEDS, UPRIGHT, Transformation
+
+# All joints in every state, with pivot states and a repeat
+UNIFORM_MOTION = """<motion>
+    <repeat>1</repeat>
+    <state name="start"><joint name="HeadYaw">0.1</joint><joint name="LShoulderPitch">1.2</joint>
+        <joint name="LHipPitch">-0.3</joint></state>
+    <state><joint name="HeadYaw">0.4</joint><joint name="LShoulderPitch">0.8</joint>
+        <joint name="LHipPitch">-0.2</joint></state>
+    <state><joint name="HeadYaw">-0.2</joint><joint name="LShoulderPitch">0.5</joint>
+        <joint name="LHipPitch">-0.1</joint></state>
+    <state name="end"><joint name="HeadYaw">0.0</joint><joint name="LShoulderPitch">1.0</joint>
+        <joint name="LHipPitch">-0.3</joint></state>
+</motion>"""
+
+# Joints that are not in every state (with the head pitch in only some of them)
+MIXED_MOTION = """<motion>
+    <state name="start"><joint name="HeadYaw">0.1</joint><joint name="HeadPitch">0.2</joint></state>
+    <state><joint name="HeadYaw">0.4</joint><joint name="RElbowRoll">0.7</joint></state>
+    <state name="end"><joint name="HeadYaw">-0.2</joint><joint name="HeadPitch">-0.1</joint>
+        <joint name="RElbowRoll">1.1</joint></state>
+    <state><joint name="HeadYaw">0.3</joint><joint name="HeadPitch">0.1</joint>
+        <joint name="RElbowRoll">0.9</joint></state>
+    <state><joint name="HeadYaw">0.0</joint><joint name="HeadPitch">0.0</joint></state>
+</motion>"""
+
+
+class ReferenceTransformation(Transformation):
+    """The original (per-joint, list based) implementation"""
+
+    def get_behavior(self):
+        behavior, pivot_states = self.get_angle_time_representation()
+        if self.emotion:
+            behavior = self.modify_flow_parameters(behavior, pivot_states)
+            behavior = self.modify_time_parameters(behavior)
+            behavior = self.modify_weight_parameters(behavior)
+            behavior = self.modify_led_parameters(behavior)
+        return behavior
+
+    def get_angle_time_representation(self):
+        if self.emotion_name == 'neutral':
+            time_increment = SPEEDS['neutral_norm']
+        else:
+            time_increment = SPEEDS['adjusted_norm']
+
+        representation = OrderedDict()
+        pivot_states = []
+        for i, state in enumerate(self.root.iter('state')):
+            if state.get('name'):
+                pivot_states.append(i)
+            for joint in state.findall('joint'):
+                angle = float(joint.text)
+                name = joint.get('name')
+                if name in representation:
+                    representation[name]['angles'].append(angle)
+                    representation[name]['times'].append(time_increment * len(representation[name]['times']))
+                else:
+                    representation.update({name: {'angles': [angle], 'times': [0]}})
+        return representation, pivot_states
+
+    def modify_flow_parameters(self, behavior, pivot_states):
+        amplitude = self.get_affective_amplitude()
+        for joint_name in behavior.keys():
+            theta_init = behavior[joint_name]['angles'][pivot_states[0]]
+            theta_end = behavior[joint_name]['angles'][pivot_states[-1]]
+            for i in range(0, len(behavior[joint_name]['times'])):
+                normalized_time = (behavior[joint_name]['times'][i] - behavior[joint_name]['times'][0]) / (
+                        behavior[joint_name]['times'][-1] - behavior[joint_name]['times'][0])
+                line_angle = theta_init * (1 - normalized_time) + theta_end * normalized_time
+                behavior[joint_name]['angles'][i] = amplitude * behavior[joint_name]['angles'][i] + (
+                        1 - amplitude) * line_angle
+        return behavior
+
+    def modify_time_parameters(self, behavior):
+        repetitions = self.get_affective_repetition()
+        repeat = self.get_repeats()
+        for joint_name in behavior.keys():
+            time_increment = behavior[joint_name]['times'][1]
+            behavior[joint_name]['angles'] = behavior[joint_name]['angles'] * (repetitions + repeat + 1)
+            for i in range(0, len(behavior[joint_name]['times']) * (repetitions + repeat)):
+                behavior[joint_name]['times'].append(time_increment * len(behavior[joint_name]['times']))
+        speed = self.get_affective_speed()
+        for joint_name in behavior.keys():
+            behavior[joint_name]['times'] = [time / speed for time in behavior[joint_name]['times']]
+        return behavior
+
+    def modify_weight_parameters(self, behavior):
+        pitch = self.get_affective_head_pitch()
+        start_time = behavior[list(behavior.keys())[0]]['times'][1]
+        if 'HeadPitch' not in behavior.keys():
+            behavior.update({'HeadPitch': {'angles': [pitch, pitch], 'times': [0, start_time]}})
+        else:
+            behavior['HeadPitch']['angles'] = [(pitch + x) for x in behavior['HeadPitch']['angles']]
+
+        if self.emotion['arousal'] < -0.5:
+            posture = BEND
+        elif self.emotion['arousal'] > 0.5:
+            posture = UPRIGHT
+        else:
+            posture = NEUTRAL
+        for joint_name in posture:
+            if joint_name not in behavior:
+                behavior.update(
+                    {joint_name: {'angles': [posture[joint_name], posture[joint_name]], 'times': [0, start_time]}})
+        return behavior
+
+    def modify_led_parameters(self, behavior):
+        if (self.emotion['valence'] == 0) and (self.emotion['arousal'] == 0):
+            return behavior
+
+        hue = degrees(atan2(self.emotion['valence'], self.emotion['arousal']))
+        if hue < 0:
+            hue = hue + 360
+        hue = hue + 5
+        hue = hue % 360
+        rgb = tuple(int(round(i * 255)) for i in hsv_to_rgb(hue / 360.0, 1, 1))
+        rgb_hex = '0x00%02X%02X%02X' % rgb
+        closed = '0x00%02X%02X%02X' % (0, 0, 0)
+        colors = [rgb_hex, rgb_hex, closed, closed]
+
+        period = (4 - 0.4) * (1 - self.emotion['arousal']) / 2.0 + 0.4
+        rise_ratio = (0.5 - 0.1) * (1 - self.emotion['arousal']) / 2.0 + 0.1
+        rise_time = [rise_ratio, 0.5, (rise_ratio + 0.5), 1.0]
+
+        duration = 0
+        for i in behavior.values():
+            if duration < max(i['times']):
+                duration = max(i['times'])
+        rep = int(round(duration / period))
+
+        if rep != 0:
+            colors = colors * rep
+
+        rise_times = list(rise_time)
+        for i in range(1, rep):
+            tmp = [rise_times[-1] + x for x in rise_time]
+            rise_times.extend(tmp)
+
+        rise_times = [x * period for x in rise_times]
+        behavior.update({'LED': {'colors': colors, 'times': rise_times}})
+        return behavior
+
+
+class TransformationTest(TestCase):
+    def assert_parity(self, motion, emotion):
+        expected = ReferenceTransformation(motion, emotion).get_behavior()
+        actual = Transformation(motion, emotion).get_behavior()
+        self.assertEqual(sorted(expected.keys()), sorted(actual.keys()))
+        for name, timeline in expected.items():
+            for field, values in timeline.items():
+                self.assertEqual(len(values), len(actual[name][field]), name + ' ' + field)
+                for value, actual_value in zip(values, actual[name][field]):
+                    if isinstance(value, str):
+                        self.assertEqual(value, actual_value, name + ' ' + field)
+                    else:
+                        self.assertAlmostEqual(value, actual_value, 9, name + ' ' + field)
+
+    def test_uniform_motion(self):
+        for emotion in [None] + sorted(EMOTIONS.keys()):
+            self.assert_parity(UNIFORM_MOTION, emotion)
+
+    def test_mixed_motion(self):
+        for emotion in [None] + sorted(EMOTIONS.keys()):
+            self.assert_parity(MIXED_MOTION, emotion)
+
+
+if __name__ == '__main__':
+    main()
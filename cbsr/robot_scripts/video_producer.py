@@ -1,18 +1,25 @@
 from argparse import ArgumentParser
 from sys import exit
 from threading import Thread
-from time import sleep
+from time import sleep, time
 
 from cbsr.device import CBSRdevice
 from qi import Application
 
+MIN_FRAME_PS = 1
+RATE_HEADROOM = 1.2  # frames are uploaded slightly faster than the fastest consumer can process them
+RATE_TIMEOUT = 10.0  # seconds after which the processing rate of a consumer that is not reported anymore is ignored
+
 
 class VideoProcessingModule(CBSRdevice):
     def __init__(self, session, name, server, username, password, resolution, colorspace, frame_ps, profiling):
         self.colorspace = colorspace
-        self.frame_ps = frame_ps
+        self.frame_ps = frame_ps  # the maximum frame rate
+        # The frame rate is adapted to the rate at which the consumers report they can process the frames
+        self.processing_rates = {}  # consumer: (frames per second, time of the report)
+        self.current_frame_ps = frame_ps
         # The watching thread will poll the camera 2 times the frame rate to make sure it is not the bottleneck.
-        self.polling_sleep = 1 / (self.frame_ps * 2)
+        self.polling_sleep = 1.0 / (self.current_frame_ps * 2)
 
         # Get the service
         self.video_service = session.service('ALVideoDevice')
@@ -36,7 +43,8 @@ class VideoProcessingModule(CBSRdevice):
         return 'cam'
 
     def get_channel_action_mapping(self):
-        return {self.get_full_channel('action_video'): self.execute}
+        return {self.get_full_channel('action_video'): self.execute,
+                self.get_full_channel('processing_rate'): self.set_processing_rate}
 
     def cleanup(self):
         if self.is_robot_watching:
@@ -55,12 +63,34 @@ class VideoProcessingModule(CBSRdevice):
             else:
                 print('Robot already stopped watching')
 
+    def set_processing_rate(self, message):
+        """A consumer reports the rate at which it can process the frames, as '<consumer>;<frames per second>'"""
+        consumer, frame_ps = message['data'].split(';')
+        self.processing_rates[consumer] = (float(frame_ps), time())
+        self.adapt_frame_rate()
+
+    def adapt_frame_rate(self):
+        """Sets the frame rate to what the fastest consumer can process (at most the maximum frame rate)"""
+        now = time()
+        rates = [frame_ps for frame_ps, reported in self.processing_rates.values() if now - reported <= RATE_TIMEOUT]
+        if rates:
+            frame_ps = min(self.frame_ps, max(MIN_FRAME_PS, int(round(max(rates) * RATE_HEADROOM))))
+        else:
+            frame_ps = self.frame_ps
+        if frame_ps != self.current_frame_ps:
+            print('Adapting the frame rate from ' + str(self.current_frame_ps) + ' to ' + str(frame_ps))
+            self.current_frame_ps = frame_ps
+            self.polling_sleep = 1.0 / (frame_ps * 2)
+            if self.is_robot_watching:
+                self.video_service.setFrameRate(self.subscriber_id, frame_ps)
+
     def start_watching(self, seconds):
         # subscribe to the module (top camera)
         self.index += 1
         self.is_robot_watching = True
+        self.adapt_frame_rate()
         self.subscriber_id = self.video_service.subscribeCamera(self.module_name, 0, self.resolution,
-                                                                self.colorspace, self.frame_ps)
+                                                                self.colorspace, self.current_frame_ps)
         print('Subscribed, starting watching thread...')
         watching_thread = Thread(target=self.watching, args=[self.subscriber_id])
         watching_thread.start()
@@ -86,10 +116,13 @@ class VideoProcessingModule(CBSRdevice):
 
     def watching(self, subscriber_id):
         # start a loop until the stop signal is received
+        last_timestamp = None
         while self.is_robot_watching:
             get_remote_start = self.profiling_start()
             nao_image = self.video_service.getImageRemote(subscriber_id)
-            if nao_image is not None:
+            # the camera is polled faster than its frame rate, so the same frame is only uploaded once
+            if nao_image is not None and (nao_image[4], nao_image[5]) != last_timestamp:
+                last_timestamp = (nao_image[4], nao_image[5])
                 self.profiling_end('GET_REMOTE', get_remote_start)
                 send_img_start = self.profiling_start()
                 pipe = self.redis.pipeline()
@@ -107,7 +140,8 @@ if __name__ == '__main__':
     parser.add_argument('--password', type=str, help='Password')
     parser.add_argument('--resolution', type=int, default=2, help='Naoqi image resolution')
     parser.add_argument('--colorspace', type=int, default=11, help='Naoqi color channel')
-    parser.add_argument('--frame_ps', type=int, default=20, help='Framerate at which images are generated')
+    parser.add_argument('--frame_ps', type=int, default=20,
+                        help='(Maximum) framerate at which images are generated')
     parser.add_argument('--profile', '-p', action='store_true', help='Enable profiling')
     args = parser.parse_args()
 
@@ -0,0 +1,23 @@
+from os import getenv
+
+from face_recognition_factory import FaceRecognitionFactory
+from vision_pipeline_service import VisionPipelineService
+
+
+class VisionPipelineFactory(FaceRecognitionFactory):
+    """Takes the place of the face recognition, people detection and emotion detection factories:
+    a single service is launched for a camera that is announced on any of their channels"""
+
+    def get_connection_channels(self):
+        return ['face_recognition', 'people_detection', 'emotion_detection']
+
+    def create_service(self, connect, identifier, disconnect):
+        return VisionPipelineService(connect, identifier, disconnect, self.get_gallery(identifier.split('-')[0]))
+
+
+if __name__ == '__main__':
+    if getenv('VISION_PIPELINE') == '1':
+        vision_pipeline_factory = VisionPipelineFactory()
+        vision_pipeline_factory.run()
+    else:
+        print('The vision pipeline is disabled (see VISION_PIPELINE)')
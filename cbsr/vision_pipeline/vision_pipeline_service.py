@@ -0,0 +1,124 @@
+from io import BytesIO
+from threading import Event, Thread
+from time import time
+
+import cv2
+import numpy as np
+from PIL import Image
+from cbsr.motion import MotionGate
+from cbsr.rate import RateReporter
+from cbsr.roi import ROIScheduler
+from cbsr.service import CBSRservice
+
+from emotion_detection_service import EmotionDetectionService
+from face_recognition_service import FaceRecognitionService
+from people_detection_service import PeopleDetectionService
+
+
+class VisionPipelineService(CBSRservice):
+    """
+    Runs face recognition, people detection and emotion detection for a camera in a single pipeline: the faces are
+    detected only once per frame, after which each of the stages processes them (and publishes on its usual channel,
+    i.e. recognised_face, detected_person and detected_emotion).
+    """
+
+    def __init__(self, connect, identifier, disconnect, gallery):
+        super(VisionPipelineService, self).__init__(connect, identifier, disconnect)
+
+        # Image size (filled later)
+        self.image_width = 0
+        self.image_height = 0
+        # Thread data
+        self.is_processing = False
+        self.save_image = False
+        self.is_image_available = False
+        self.image_available_flag = Event()
+        # Only frames in which the scene changed (or one per heartbeat) are processed
+        self.motion_gate = MotionGate()
+        # Faces are searched for around where they were in the previous frame first
+        self.roi = ROIScheduler()
+        # The camera adapts its frame rate to the rate at which the frames are processed
+        self.rate_reporter = RateReporter(self, 'vision_pipeline')
+        # The stages (which are not subscribed to anything themselves)
+        self.face_recognition = FaceRecognitionService(connect, identifier, disconnect, gallery)
+        self.people_detection = PeopleDetectionService(connect, identifier, disconnect)
+        self.emotion_detection = EmotionDetectionService(connect, identifier, disconnect)
+
+    def get_device_types(self):
+        return ['cam']
+
+    def get_channel_action_mapping(self):
+        return {self.get_full_channel('events'): self.execute,
+                self.get_full_channel('image_available'): self.set_image_available,
+                self.get_full_channel('action_take_picture'): self.take_picture}
+
+    def execute(self, message):
+        data = message['data']
+        if data == 'WatchingStarted':
+            if not self.is_processing:
+                self.is_processing = True
+                vision_pipeline_thread = Thread(target=self.process)
+                vision_pipeline_thread.start()
+            else:
+                print('Vision pipeline already running for ' + self.identifier)
+        elif data == 'WatchingDone':
+            if self.is_processing:
+                self.is_processing = False
+                self.image_available_flag.set()
+            else:
+                print('Vision pipeline already stopped for ' + self.identifier)
+
+    def process(self):
+        for event in ['FaceRecognitionStarted', 'PeopleDetectionStarted', 'EmotionDetectionStarted']:
+            self.produce_event(event)
+        while self.is_processing:
+            if self.is_image_available:
+                self.is_image_available = False
+                self.image_available_flag.clear()
+                started = time()
+
+                # Create a PIL Image from the byte string redis result
+                image_stream = self.redis.get(self.get_full_channel('image_stream'))
+                if self.image_width == 0:
+                    image_size_string = self.redis.get(self.get_full_channel('image_size'))
+                    self.image_width = int(image_size_string[0:4])
+                    self.image_height = int(image_size_string[4:])
+                image = Image.frombytes('RGB', (self.image_width, self.image_height), image_stream)
+
+                # If image needs to be saved, publish it on Redis
+                if self.save_image:
+                    bytes_io = BytesIO()
+                    image.save(bytes_io)
+                    self.publish('picture_newfile', bytes_io.getvalue())
+                    self.save_image = False
+
+                ima = np.asarray(image, dtype=np.uint8)
+                if not self.motion_gate.is_changed(ima):
+                    continue
+
+                # Convert to OpenCV
+                rgb_image = cv2.cvtColor(ima, cv2.COLOR_BGRA2RGB)
+                gray_image = cv2.cvtColor(ima, cv2.COLOR_BGRA2GRAY)
+
+                # Detect all faces once, and pass them on to each of the stages
+                faces = self.roi.detect(rgb_image, FaceRecognitionService.detect_faces)
+                self.people_detection.report_people(faces)
+                self.face_recognition.recognise_faces(rgb_image[:, :, ::-1], faces)
+                self.emotion_detection.classify_emotions(gray_image, faces)
+                self.rate_reporter.processed(started)
+            else:
+                self.image_available_flag.wait()
+        for event in ['FaceRecognitionDone', 'PeopleDetectionDone', 'EmotionDetectionDone']:
+            self.produce_event(event)
+
+    def set_image_available(self, message):
+        if not self.is_image_available:
+            self.is_image_available = True
+            self.image_available_flag.set()
+
+    def take_picture(self, message):
+        self.save_image = True
+
+    def cleanup(self):
+        self.image_available_flag.set()
+        self.is_processing = False